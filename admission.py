@@ -0,0 +1,287 @@
+"""
+Admission Control สำหรับ endpoint ที่โดนหนักช่วงใกล้ปิดรับ
+
+แต่ละ route มี budget ของตัวเอง:
+- Token bucket ต่อ client (IP) -> เกินแล้วตอบ 429 + Retry-After
+- Token bucket ต่อ (IP, user) ถ้า route ระบุ user_field ใน JSON body: หัก token เฉพาะ request ที่ล้มเหลว
+  (เช่น login รหัสผิด) ใช้กัน brute-force รหัสของ user คนเดียว โดยคนอื่นล็อก user นั้นจาก IP อื่นไม่ได้
+- Concurrency limit ต่อ route พร้อมคิวรอจำกัดขนาด -> คิวเต็ม/รอนานเกินตอบ 503 + Retry-After
+
+/api/login มี budget แยก เพื่อไม่ให้งาน bcrypt แย่ง worker ของ /api/generate
+
+ตั้งค่าผ่าน env ในรูปแบบ "rate=5,burst=10,concurrency=8,queue=32" เช่น
+    ADMISSION_GENERATE=rate=5,burst=10,concurrency=8,queue=32
+
+IP ของ client อ่านจาก X-Forwarded-For เฉพาะ hop ที่ proxy ที่เชื่อถือได้เติมเข้ามา
+(TRUSTED_PROXY_COUNT ตัวจากขวา) ค่าทางซ้ายกว่านั้น client ปลอมได้
+"""
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class TokenBucket:
+    """Token bucket ต่อ client เก็บแค่ (tokens, last_refill) ใน OrderedDict แบบ LRU"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, client: str) -> float:
+        """เหมือน take แต่ไม่หัก token"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, client: str) -> float:
+        """คืน 0 ถ้าผ่าน ไม่งั้นคืนจำนวนวินาทีที่ต้องรอ"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RouteBudget:
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int, queue: int, queue_timeout: float,
+                 user_field: Optional[str] = None, user_rate: float = 0, user_burst: float = 0,
+                 user_fail_status: int = 401):
+        """
+        user_field: ชื่อ field ใน JSON body ที่ใช้เป็น key ต่อ user (เช่น username ของ login)
+        user_rate / user_burst: budget ของ (IP, user) หักเฉพาะ response ที่ status = user_fail_status
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.user_field = user_field
+        self.user_fail_status = user_fail_status
+        self.user_bucket = TokenBucket(user_rate, user_burst) if user_rate > 0 and user_field else None
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_busy = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # สร้างตอนมี event loop แล้วเท่านั้น
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_rate": self.rejected_rate,
+            "rejected_busy": self.rejected_busy,
+        }
+
+
+def parse_budget_spec(spec: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """แปลง "rate=5,burst=10" เป็น dict โดยใช้ defaults กับค่าที่ไม่ได้ระบุ"""
+    values = dict(defaults)
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        k, v = part.split("=", 1)
+        k = k.strip()
+        if k in values:
+            values[k] = float(v)
+    return values
+
+
+def budget_from_env(name: str, env_var: str, defaults: Dict[str, float], queue_timeout: float,
+                    user_field: Optional[str] = None, user_env_var: Optional[str] = None,
+                    user_defaults: Optional[Dict[str, float]] = None) -> RouteBudget:
+    cfg = parse_budget_spec(os.getenv(env_var, ""), defaults)
+    user_cfg = {"rate": 0, "burst": 0}
+    if user_field:
+        user_cfg = parse_budget_spec(os.getenv(user_env_var or "", ""), user_defaults or user_cfg)
+    return RouteBudget(
+        name,
+        rate=cfg["rate"],
+        burst=cfg["burst"],
+        concurrency=int(cfg["concurrency"]),
+        queue=int(cfg["queue"]),
+        queue_timeout=queue_timeout,
+        user_field=user_field,
+        user_rate=user_cfg["rate"],
+        user_burst=user_cfg["burst"],
+    )
+
+
+class AdmissionController:
+    def __init__(self, routes: List[Tuple[str, str, bool, RouteBudget]]):
+        """routes: [(method, path, is_prefix, budget)] ตรวจตามลำดับ ตัวแรกที่ตรงชนะ"""
+        self.routes = routes
+
+    def match(self, method: str, path: str) -> Optional[RouteBudget]:
+        for route_method, route_path, is_prefix, budget in self.routes:
+            if method != route_method:
+                continue
+            if path == route_path or (is_prefix and path.startswith(route_path + "/")):
+                return budget
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {budget.name: budget.stats() for _, _, _, budget in self.routes}
+
+
+# อ่าน body มาหา user key ไม่เกินนี้ ใหญ่กว่านี้ไม่ parse แล้วส่งต่อให้ app อ่านส่วนที่เหลือเอง
+MAX_USER_KEY_BODY = 16 * 1024
+
+
+def client_key(scope, trusted_proxies: int = 0) -> str:
+    """
+    IP ของ client
+    trusted_proxies=0 -> ใช้ IP ที่ต่อเข้ามาตรงๆ (scope["client"])
+    trusted_proxies=N -> ใช้ entry ที่ N จากขวาของ X-Forwarded-For (hop ที่ proxy ตัวนอกสุดที่เชื่อถือได้เติม)
+    """
+    if trusted_proxies > 0:
+        forwarded = []
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                forwarded += [ip.strip() for ip in value.decode("latin-1").split(",") if ip.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _read_body(receive, limit: int) -> Tuple[List[dict], bytes, bool]:
+    """
+    อ่าน body ไม่เกิน limit byte คืน (message ที่อ่านแล้ว, body, complete)
+    complete=False -> body ยาวเกิน limit หรือ client ตัดไปก่อน (ส่วนที่เหลือยังไม่ได้อ่าน)
+    """
+    messages: List[dict] = []
+    body = b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return messages, body, False
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return messages, body, True
+        if len(body) > limit:
+            return messages, body, False
+
+
+def _user_key(body: bytes, field: str) -> Optional[str]:
+    if not body:
+        return None
+    try:
+        value = json.loads(body).get(field)
+    except (ValueError, AttributeError):
+        return None
+    return str(value).strip().lower() if value else None
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware (ต้อง add ก่อน CORSMiddleware เพื่อให้ 429/503 มี CORS headers)"""
+
+    def __init__(self, app, controller: AdmissionController, trusted_proxies: int = 0):
+        self.app = app
+        self.controller = controller
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        budget = self.controller.match(scope["method"], scope["path"])
+        if budget is None:
+            return await self.app(scope, receive, send)
+
+        # 1. Rate limit ต่อ client
+        if budget.bucket:
+            wait = budget.bucket.take(client_key(scope, self.trusted_proxies))
+            if wait > 0:
+                budget.rejected_rate += 1
+                return await self._reject(send, 429, "Too many requests", wait)
+
+        # 1.1 Rate limit ต่อ (IP, user) นับเฉพาะ request ที่ล้มเหลว (อ่าน body มาก่อน แล้วส่งต่อให้ app ตามเดิม)
+        user_key = None
+        if budget.user_bucket:
+            original_receive = receive
+            messages, body, complete = await _read_body(original_receive, MAX_USER_KEY_BODY)
+
+            async def receive():
+                if messages:
+                    return messages.pop(0)
+                return await original_receive()
+
+            user = _user_key(body, budget.user_field) if complete else None
+            if user:
+                user_key = f"{client_key(scope, self.trusted_proxies)}|{user}"
+                wait = budget.user_bucket.peek(user_key)
+                if wait > 0:
+                    budget.rejected_rate += 1
+                    return await self._reject(send, 429, "Too many requests", wait)
+
+                original_send = send
+
+                async def send(message):
+                    if message["type"] == "http.response.start" and message["status"] == budget.user_fail_status:
+                        budget.user_bucket.take(user_key)
+                    await original_send(message)
+
+        # 2. Concurrency limit ต่อ route (รอในคิวได้จำกัด)
+        if budget.waiting >= budget.queue and budget.semaphore.locked():
+            budget.rejected_busy += 1
+            return await self._reject(send, 503, "Server busy, please retry", 1)
+
+        budget.waiting += 1
+        try:
+            await asyncio.wait_for(budget.semaphore.acquire(), timeout=budget.queue_timeout)
+        except asyncio.TimeoutError:
+            budget.rejected_busy += 1
+            return await self._reject(send, 503, "Server busy, please retry", budget.queue_timeout)
+        finally:
+            budget.waiting -= 1
+
+        budget.in_flight += 1
+        budget.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            budget.in_flight -= 1
+            budget.semaphore.release()
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,116 @@
+"""
+In-process TTL cache สำหรับข้อมูลที่อ่านบ่อยแต่เขียนไม่บ่อย
+(templates, lotteries, users, global_configs)
+
+Cache แต่ละตัวผูกกับชื่อตารางใน CacheRegistry
+เมื่อมี change event (table, id) เข้ามาจาก InvalidationBus
+registry จะ evict เฉพาะ entry ที่ตรง id หรือล้างทั้ง cache ถ้าเป็น cache แบบ listing
+
+กัน race ระหว่างโหลดกับ invalidate ด้วย generation counter:
+อ่าน generation() ก่อนเริ่มโหลด แล้วส่งกลับมาใน set(..., generation=gen)
+ถ้ามีการ invalidate เกิดขึ้นระหว่างโหลด ค่าที่โหลดมา (อาจเป็นค่าก่อนเขียน) จะไม่ถูกเก็บ
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MISSING = object()
+
+# event ที่ table เป็น "*" หมายถึงล้างทุก cache (เช่น listener เพิ่ง reconnect อาจพลาด event ไป)
+ALL_TABLES = "*"
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float, keyed_by_id: bool = True):
+        """
+        keyed_by_id=True  -> key ของ cache คือ id ของ row (evict ทีละตัวได้)
+        keyed_by_id=False -> cache แบบ listing/รวมหลาย row (ล้างทั้งหมดเมื่อมีการเปลี่ยนแปลง)
+        """
+        self.name = name
+        self.ttl = ttl
+        self.keyed_by_id = keyed_by_id
+        self._data: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key: Any, default: Any = MISSING) -> Any:
+        """คืนค่าล่าสุดแม้จะหมดอายุแล้ว (ใช้ตอน database มีปัญหา)"""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[1]
+
+    def generation(self) -> int:
+        """อ่านก่อนเริ่มโหลดจาก database แล้วส่งให้ set() ตอนโหลดเสร็จ"""
+        with self._lock:
+            return self._generation
+
+    def set(self, key: Any, value: Any, generation: Optional[int] = None, ttl: Optional[float] = None) -> bool:
+        """
+        เก็บค่าลง cache คืน False ถ้าไม่ได้เก็บเพราะมีการ invalidate ระหว่างโหลด
+        ttl=None ใช้ ttl ของ cache (warm-up ส่ง ttl ยาวถึงหลัง closing_time)
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            return True
+
+    def evict(self, key: Any):
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def invalidate(self, row_id: Optional[Any] = None):
+        if self.keyed_by_id and row_id is not None:
+            self.evict(str(row_id))
+        else:
+            self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class CacheRegistry:
+    """จับคู่ตาราง -> caches ที่ต้อง invalidate เมื่อตารางนั้นเปลี่ยน"""
+
+    def __init__(self):
+        self._by_table: Dict[str, List[Tuple[TTLCache, bool]]] = {}
+        self._caches: Dict[str, TTLCache] = {}
+
+    def register(self, cache: TTLCache, tables: Iterable[str]) -> TTLCache:
+        """
+        ตารางแรกใน tables คือตารางที่ key ของ cache อ้างถึง (evict ตาม id ได้)
+        ตารางที่เหลือเป็นตารางที่ join เข้ามา เปลี่ยนเมื่อไหร่ล้างทั้ง cache
+        """
+        self._caches[cache.name] = cache
+        for i, table in enumerate(tables):
+            self._by_table.setdefault(table, []).append((cache, i == 0))
+        return cache
+
+    def on_change(self, table: str, row_id: Optional[Any] = None):
+        if table == ALL_TABLES:
+            for cache in self._caches.values():
+                cache.clear()
+            return
+        for cache, is_key_table in self._by_table.get(table, []):
+            cache.invalidate(row_id if is_key_table else None)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: cache.stats() for name, cache in self._caches.items()}
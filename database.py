@@ -1,6 +1,8 @@
 import os
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
+import time
+from resilience import CircuitBreaker, ResilientExecutor, FaultInjector, current_deadline
 
 # โหลดค่าจาก .env
 load_dotenv()
@@ -11,7 +13,74 @@ key: str = os.environ.get("SUPABASE_KEY")
 if not url or not key:
     raise ValueError("Supabase credentials not found in .env file")
 
+# Timeout ต่อ 1 attempt (วินาที) กัน worker ค้างเมื่อ PostgREST ช้า
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
 # สร้างตัวเชื่อมต่อ (Client)
-supabase: Client = create_client(url, key)
+supabase: Client = create_client(url, key, options=ClientOptions(
+    postgrest_client_timeout=SUPABASE_TIMEOUT,
+    storage_client_timeout=int(SUPABASE_TIMEOUT),
+))
+
+def _tune_connection_pool(client: Client):
+    """
+    เปลี่ยน httpx session ของ PostgREST ให้ใช้ HTTP/2 + keep-alive pool ที่กำหนดเอง
+    (supabase-py ยังไม่เปิดให้ตั้ง limits ผ่าน ClientOptions)
+    """
+    try:
+        import httpx
+
+        class DeadlineClient(httpx.Client):
+            """ตัด timeout ของแต่ละ request ไม่ให้เกินเวลาที่เหลือของ db.read() ที่กำลังทำงาน"""
+
+            def request(self, *args, **kwargs):
+                deadline = current_deadline()
+                if deadline is not None:
+                    remaining = max(deadline - time.monotonic(), 0.001)
+                    attempt_timeout = min(SUPABASE_TIMEOUT, remaining)
+                    kwargs["timeout"] = httpx.Timeout(attempt_timeout, connect=min(attempt_timeout, 5.0))
+                return super().request(*args, **kwargs)
+
+        postgrest = client.postgrest
+        old_session = postgrest.session
+        postgrest.session = DeadlineClient(
+            base_url=old_session.base_url,
+            headers=old_session.headers,
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=min(SUPABASE_TIMEOUT, 5.0)),
+            # คงค่าเดิมของ session ที่ postgrest สร้างไว้ (default ของ postgrest: verify=True, proxy=None)
+            follow_redirects=old_session.follow_redirects,
+            trust_env=old_session.trust_env,
+            verify=getattr(postgrest, "verify", True),
+            proxy=getattr(postgrest, "proxy", None),
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "50")),
+                max_keepalive_connections=int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "60")),
+            ),
+        )
+        old_session.close()
+    except Exception as e:
+        print("⚠️  Supabase connection pool tuning skipped:", e)
+
+_tune_connection_pool(supabase)
+
+# Retry / Circuit breaker สำหรับทุกการเรียก Supabase จาก main.py
+db = ResilientExecutor(
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("SUPABASE_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("SUPABASE_BREAKER_RESET", "30")),
+    ),
+    read_retries=int(os.getenv("SUPABASE_READ_RETRIES", "2")),
+    read_deadline=float(os.getenv("SUPABASE_READ_DEADLINE", "15")),
+)
+
+# 🧪 จำลอง Supabase ล่ม/ช้า สำหรับทดสอบในเครื่องเท่านั้น
+if os.getenv("SUPABASE_FAULT_RATE") or os.getenv("SUPABASE_FAULT_LATENCY"):
+    db.fault_injector = FaultInjector(
+        failure_rate=float(os.getenv("SUPABASE_FAULT_RATE", "0")),
+        latency=float(os.getenv("SUPABASE_FAULT_LATENCY", "0")),
+    )
+    print("🧪 Supabase fault injection enabled:", db.fault_injector.stats())
 
 print("✅ Supabase Connected Successfully!")
\ No newline at end of file
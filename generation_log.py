@@ -0,0 +1,226 @@
+"""
+Generation Log: บันทึกประวัติการออกเลขแบบ append-only
+โดยไม่เพิ่ม latency ให้ /api/generate
+
+- Handler แค่ enqueue record เล็กๆ เข้า queue ในหน่วยความจำ
+- Background thread คอย flush ลงตาราง generation_log เป็น batch
+  (flush เมื่อครบ batch size หรือครบเวลา flush interval อย่างใดอย่างหนึ่งก่อน)
+- ถ้า database ใช้ไม่ได้ จะเขียนลง spill file (JSON Lines) แทน (จำกัดขนาด เกินแล้วทิ้ง)
+  แล้วค่อย replay กลับเข้า database ทีละ batch ในรอบ flush ถัดๆ ไป
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+TABLE_NAME = "generation_log"
+
+
+class GenerationLogger:
+    def __init__(
+        self,
+        client,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        max_queue: int = 10000,
+        spill_path: str = "generation_log.spill.jsonl",
+        max_spill_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._spill_lock = threading.Lock()
+        # ตำแหน่ง (byte) ใน spill file ที่ replay เข้า database แล้ว
+        self._spill_offset = 0
+        # enqueued / dropped ถูกแก้จากหลาย request thread
+        self._metrics_lock = threading.Lock()
+
+        # --- Metrics ---
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.spilled = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    # ---------- Producer side (เรียกจาก request handler) ----------
+
+    def log(self, template_id: str, seed: Optional[str], results: Dict[str, str],
+            draw_date: Optional[str] = None, deterministic: bool = False) -> bool:
+        """
+        ใส่ record เข้า queue แบบไม่ block ถ้า queue เต็มจะทิ้งแล้วนับเป็น dropped
+        draw_date + deterministic ทำให้คำนวณชุดเลขของ record โหมด deterministic ซ้ำได้ภายหลัง
+        """
+        record = {
+            "template_id": template_id,
+            "seed": seed,
+            "results": results,
+            "draw_date": draw_date,
+            "deterministic": deterministic,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count_dropped(1)
+            return False
+        with self._metrics_lock:
+            self.enqueued += 1
+        return True
+
+    def _count_dropped(self, n: int):
+        with self._metrics_lock:
+            self.dropped += n
+
+    # ---------- Lifecycle ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="generation-log-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """หยุด flusher แล้ว flush ของที่ค้างอยู่ใน queue ให้หมด"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                # flusher ยังค้างอยู่ใน insert ที่ช้า ไม่ drain ซ้อนกัน (ของที่ค้างจะหายไปกับ process)
+                print(f"Generation log flusher still busy, {self._queue.qsize()} records not drained")
+                return
+            self._thread = None
+        self._drain_all()
+
+    # ---------- Consumer side (background thread) ----------
+
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        """รอจนครบ batch size หรือหมดเวลา flush interval"""
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            elif os.path.exists(self.spill_path):
+                self._replay_spill_safely()
+
+    def _drain_all(self):
+        while True:
+            batch: List[Dict[str, Any]] = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        started = time.perf_counter()
+        try:
+            self.client.table(TABLE_NAME).insert(batch).execute()
+            self.flushed += len(batch)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            self._spill(batch)
+            return
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flush_count += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+        # Database กลับมาแล้ว ลอง replay ของที่ spill ไว้ (ทีละ batch ไม่ให้ flusher ค้าง)
+        self._replay_spill_safely()
+
+    def _replay_spill_safely(self):
+        try:
+            self._replay_spill()
+        except Exception as e:
+            self.last_error = f"spill replay: {e}"
+
+    # ---------- Spill file ----------
+
+    def _spill(self, batch: List[Dict[str, Any]]):
+        try:
+            with self._spill_lock:
+                size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+                if size >= self.max_spill_bytes:
+                    self.last_error = "spill file full, records dropped"
+                    self._count_dropped(len(batch))
+                    return
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for record in batch:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.spilled += len(batch)
+        except OSError as e:
+            print("Generation log spill failed:", e)
+            self._count_dropped(len(batch))
+
+    def _replay_spill(self):
+        """replay spill file 1 batch ต่อครั้ง ลบไฟล์เมื่อ replay ครบ"""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                self._spill_offset = 0
+                return
+            records: List[Dict[str, Any]] = []
+            with open(self.spill_path, "rb") as f:
+                f.seek(self._spill_offset)
+                while len(records) < self.batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        records.append(json.loads(line))
+                offset = f.tell()
+            if records:
+                # insert ล้มเหลว -> exception หลุดออกไปโดยไม่ขยับ offset แล้วลองใหม่รอบหน้า
+                # (restart ระหว่าง replay จะเริ่มจากต้นไฟล์ record อาจซ้ำได้ append-only log ยอมรับได้)
+                self.client.table(TABLE_NAME).insert(records).execute()
+                self.flushed += len(records)
+            if offset >= os.path.getsize(self.spill_path):
+                os.remove(self.spill_path)
+                self._spill_offset = 0
+            else:
+                self._spill_offset = offset
+
+    # ---------- Instrumentation ----------
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+            "flush_count": self.flush_count,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "last_error": self.last_error,
+        }
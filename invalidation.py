@@ -0,0 +1,220 @@
+"""
+Cache Invalidation Bus: กระจาย change event (table, id) ไปยังทุก worker
+
+- write endpoints ใน main.py เรียก bus.publish(table, id) หลังเขียนสำเร็จ
+- ทุก worker subscribe แล้ว evict cache ที่เกี่ยวข้อง (ผ่าน CacheRegistry.on_change)
+- การแก้ไขจาก Admin console / instance อื่นที่เขียนตรงเข้า Supabase
+  จะถูกจับโดย trigger ใน sql/002_cache_invalidation.sql ที่ส่ง pg_notify มาที่ channel เดียวกัน
+
+Transports:
+- InMemoryTransport: ภายใน process เดียว (default และใช้ในการทดสอบ)
+- PostgresNotifyTransport: LISTEN/NOTIFY ผ่าน Postgres ของ Supabase (ต้องติดตั้ง psycopg)
+  publish แค่ใส่ queue ส่ง NOTIFY จาก background thread การเขียนจึงไม่ต้องรอ Postgres
+"""
+
+import json
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+Event = Dict[str, Any]
+Handler = Callable[[Event], None]
+
+DEFAULT_CHANNEL = "cache_invalidation"
+
+
+class InMemoryTransport:
+    """ส่ง event ให้ทุก subscriber ใน process เดียวกันทันที"""
+
+    def __init__(self):
+        self._handlers: List[Handler] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: Handler):
+        with self._lock:
+            self._handlers.append(handler)
+
+    def publish(self, event: Event):
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            handler(event)
+
+    def close(self):
+        pass
+
+
+class PostgresNotifyTransport:
+    """
+    ใช้ Postgres LISTEN/NOTIFY เป็นช่องทางกระจาย event ข้าม instance
+    ต้องใช้ direct connection string ของ Supabase (ไม่ใช่ผ่าน PgBouncer แบบ transaction mode)
+    """
+
+    def __init__(self, dsn: str, channel: str = DEFAULT_CHANNEL, reconnect_delay: float = 5.0,
+                 connect_timeout: int = 5, max_pending: int = 1000):
+        try:
+            import psycopg  # optional dependency
+        except ImportError as e:
+            raise RuntimeError("PostgresNotifyTransport requires 'psycopg' (pip install psycopg[binary])") from e
+
+        self._psycopg = psycopg
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.connect_timeout = connect_timeout
+        self._handlers: List[Handler] = []
+        self._stop = threading.Event()
+        self._pending: "queue.Queue[Event]" = queue.Queue(maxsize=max_pending)
+        self._publish_conn = None
+        # มี event ที่ส่งไม่ออก -> พอต่อได้ให้ส่ง "*" ให้ instance อื่นล้าง cache ทั้งหมด
+        self._missed = False
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._listen_loop, name="cache-invalidation-listener", daemon=True)
+        self._thread.start()
+        self._publisher = threading.Thread(target=self._publish_loop, name="cache-invalidation-publisher", daemon=True)
+        self._publisher.start()
+
+    def _connect(self):
+        return self._psycopg.connect(self.dsn, autocommit=True, connect_timeout=self.connect_timeout)
+
+    def subscribe(self, handler: Handler):
+        self._handlers.append(handler)
+
+    def publish(self, event: Event):
+        """ไม่ block: ใส่ queue ให้ publisher thread ส่ง ถ้า queue เต็มจะทิ้งแล้วส่ง "*" แทนภายหลัง"""
+        try:
+            self._pending.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            self._missed = True
+
+    def _publish_loop(self):
+        while not self._stop.is_set():
+            try:
+                event = self._pending.get(timeout=1.0)
+            except queue.Empty:
+                if not self._missed:
+                    continue
+                event = None
+            try:
+                if self._publish_conn is None or self._publish_conn.closed:
+                    self._publish_conn = self._connect()
+                if self._missed:
+                    self._notify({"table": "*", "id": None})
+                    self._missed = False
+                if event is not None:
+                    self._notify(event)
+            except Exception as e:
+                self.errors += 1
+                print("Cache invalidation publish error:", e)
+                if self._publish_conn is not None:
+                    self._publish_conn.close()
+                    self._publish_conn = None
+                # event ที่ค้างอยู่รวมเป็น "*" ครั้งเดียวตอนต่อได้ แทนการส่งทีละตัว
+                self._missed = True
+                while True:
+                    try:
+                        self._pending.get_nowait()
+                    except queue.Empty:
+                        break
+                self._stop.wait(self.reconnect_delay)
+
+    def _notify(self, event: Event):
+        self._publish_conn.execute("SELECT pg_notify(%s, %s)", (self.channel, json.dumps(event)))
+        self.sent += 1
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            try:
+                with self._connect() as conn:
+                    conn.execute(f'LISTEN "{self.channel}"')
+                    # NOTIFY ที่ส่งมาตอน listener หลุดจะหายไป ล้าง cache ทั้งหมดทุกครั้งที่ (re)connect
+                    self._dispatch(json.dumps({"table": "*", "id": None}))
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self._dispatch(notify.payload)
+            except Exception as e:
+                print("Cache invalidation listener error:", e)
+                self._stop.wait(self.reconnect_delay)
+
+    def _dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        for handler in self._handlers:
+            handler(event)
+
+    def close(self):
+        self._stop.set()
+        self._publisher.join(timeout=self.connect_timeout + 1)
+        if self._publish_conn is not None:
+            self._publish_conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": self._pending.qsize(), "sent": self.sent, "dropped": self.dropped, "errors": self.errors}
+
+
+class InvalidationBus:
+    def __init__(self, transport=None):
+        self.transport = transport or InMemoryTransport()
+        self._handlers: List[Handler] = []
+        self.published = 0
+        self.received = 0
+        self.publish_errors = 0
+        self._origin = uuid.uuid4().hex
+        self.transport.subscribe(self._on_transport_event)
+
+    def subscribe(self, handler: Callable[[str, Optional[str]], None]):
+        """handler(table, row_id) - row_id เป็น None หมายถึงทั้งตาราง, table "*" หมายถึงทุกตาราง"""
+        self._handlers.append(lambda event: handler(event.get("table"), event.get("id")))
+
+    def publish(self, table: str, row_id: Optional[Any] = None):
+        """
+        ประกาศว่า row ในตารางมีการเปลี่ยนแปลง
+        ไม่ raise เด็ดขาด: การ invalidate ล้มเหลวไม่ควรทำให้การเขียนที่สำเร็จแล้วกลายเป็น 500
+        """
+        event = {
+            "table": table,
+            "id": str(row_id) if row_id is not None else None,
+            "origin": self._origin,
+            "ts": time.time(),
+        }
+        # evict ใน worker นี้ทันที ไม่ต้องรอ round-trip ของ transport
+        self._dispatch(event)
+        try:
+            self.transport.publish(event)
+            self.published += 1
+        except Exception as e:
+            self.publish_errors += 1
+            print("Cache invalidation publish error:", e)
+
+    def _on_transport_event(self, event: Event):
+        # event ที่ worker นี้ publish เองถูก dispatch ไปแล้วใน publish()
+        if event.get("origin") == self._origin:
+            return
+        self._dispatch(event)
+
+    def _dispatch(self, event: Event):
+        self.received += 1
+        for handler in self._handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                print("Cache invalidation handler error:", e)
+
+    def close(self):
+        self.transport.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": type(self.transport).__name__,
+            "published": self.published,
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+            "transport_stats": self.transport.stats() if hasattr(self.transport, "stats") else None,
+        }
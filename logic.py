@@ -1,8 +1,74 @@
+import hashlib
+import hmac
+import random
 import secrets
 
+
+class KeyedRandom(random.Random):
+    """
+    PRNG แบบ deterministic: HMAC-SHA256(key, counter) ต่อกันเป็น stream (counter mode)
+    ได้ผลเหมือนเดิมทุกครั้งถ้า key เหมือนเดิม และไม่ต้องเรียก OS entropy ระหว่างสุ่ม
+    """
+
+    def __init__(self, key: bytes):
+        self._key = key
+        self._counter = 0
+        self._buffer = b""
+        super().__init__()
+
+    def seed(self, *args, **kwargs):
+        # random.Random.__init__ เรียก seed() เสมอ state ของเรามาจาก key อย่างเดียว
+        pass
+
+    def _read(self, n: int) -> bytes:
+        while len(self._buffer) < n:
+            block = hmac.new(self._key, self._counter.to_bytes(8, "big"), hashlib.sha256).digest()
+            self._buffer += block
+            self._counter += 1
+        out, self._buffer = self._buffer[:n], self._buffer[n:]
+        return out
+
+    def getrandbits(self, k: int) -> int:
+        if k <= 0:
+            return 0
+        value = int.from_bytes(self._read((k + 7) // 8), "big")
+        return value >> (-k % 8)
+
+    def random(self) -> float:
+        return self.getrandbits(53) / (1 << 53)
+
+    def getstate(self):
+        return self._key, self._counter, self._buffer
+
+    def setstate(self, state):
+        self._key, self._counter, self._buffer = state
+
+
+def derive_key(secret: str, seed: str, draw_date: str, template_id: str = "") -> bytes:
+    """
+    สร้าง key ของ stream จาก secret ฝั่ง server + seed + วันที่งวด (+ template)
+    แต่ละ field ขึ้นต้นด้วยความยาว 4 byte กันกรณี field ต่างกันแต่ต่อกันแล้วได้ข้อความเดียวกัน
+    (เช่น seed="1|2024-01-01" กับ seed="1" + draw_date="2024-01-01")
+
+    หมายเหตุ: stream จาก key เป็น HMAC ที่คงที่ แต่การแปลง stream เป็นชุดเลขใช้
+    random.Random.sample / shuffle / choice / randint ของ CPython ซึ่งอัลกอริทึมเปลี่ยนได้ข้ามเวอร์ชัน
+    เวอร์ชัน Python (ตาม Dockerfile) จึงเป็นส่วนหนึ่งของการตรวจสอบย้อนหลัง ต้อง re-render ด้วยเวอร์ชันเดียวกัน
+    """
+    message = b"".join(
+        len(part).to_bytes(4, "big") + part
+        for part in (field.encode("utf-8") for field in (seed or "", draw_date, template_id or ""))
+    )
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()
+
+
 class LotteryLogic:
-    def __init__(self, seed: str = None):
+    def __init__(self, seed: str = None, rng: random.Random = None):
+        """
+        rng=None -> สุ่มด้วย secrets (SystemRandom) เหมือนเดิม
+        rng=KeyedRandom(...) -> โหมด deterministic ได้ชุดเลขเดิมทุกครั้งจาก key เดียวกัน
+        """
         self.seed = seed
+        self.rng = rng or secrets.SystemRandom()
         # สร้าง "ถังเลขวิน" (Win Pool) เตรียมไว้เลย 1 ชุด สำหรับรอบนี้
         self.win_pool = self._create_win_pool()
 
@@ -11,53 +77,55 @@ class LotteryLogic:
         สร้างกลุ่มเลขวิน 6 ตัว (Master Set)
         โดยยึดเลข Seed เป็นหลัก แล้วสุ่มเลขอื่นมาเติมให้ครบ
         """
-        pool = set()
-        
+        # ใช้ list แทน set เพื่อให้ลำดับไม่ขึ้นกับ hash randomization (จำเป็นสำหรับโหมด deterministic)
+        pool = []
+
         # 1. เอาเลข Seed ใส่เข้าไปก่อน (ถ้ามี)
         if self.seed:
             for char in self.seed:
-                if char.isdigit():
-                    pool.add(char)
-        
+                if char.isdigit() and char not in pool:
+                    pool.append(char)
+
         # 2. สุ่มเลขอื่นมาเติมให้ครบ 6 ตัว (ไม่ให้ซ้ำในถัง)
         all_digits = list('0123456789')
         while len(pool) < 6:
-            pool.add(str(secrets.choice(all_digits)))
-            
-        # แปลงเป็น List แล้วสลับตำแหน่งให้เนียน
-        pool_list = list(pool)
-        secrets.SystemRandom().shuffle(pool_list)
-        return pool_list
+            digit = self.rng.choice(all_digits)
+            if digit not in pool:
+                pool.append(digit)
+
+        # สลับตำแหน่งให้เนียน
+        self.rng.shuffle(pool)
+        return pool
 
     def generate(self, key_type: str) -> str:
         """
         ฟังก์ชันตัดสินใจว่าจะคืนค่าเลขอะไรตาม key_type
         โดยหยิบวัตถุดิบมาจาก self.win_pool
         """
-        
+
         if key_type == "win":
             # คืนค่าเลขวินทั้งดุ้น (เช่น "8-5-1-2-9-0")
             return "-".join(self.win_pool)
 
         elif key_type == "digit_3":
             # หยิบ 3 ตัวจากถังวิน มาเรียงกัน
-            picks = secrets.SystemRandom().sample(self.win_pool, 3)
+            picks = self.rng.sample(self.win_pool, 3)
             return "".join(picks)
 
         elif key_type == "digit_2_top":
             # หยิบ 2 ตัวจากถังวิน
-            picks = secrets.SystemRandom().sample(self.win_pool, 2)
+            picks = self.rng.sample(self.win_pool, 2)
             return "".join(picks)
 
         elif key_type == "digit_2_bottom":
             # หยิบ 2 ตัวจากถังวิน (สุ่มใหม่ อาจซ้ำกับ top ได้ เพราะเป็น random selection แยกกัน)
-            picks = secrets.SystemRandom().sample(self.win_pool, 2)
+            picks = self.rng.sample(self.win_pool, 2)
             return "".join(picks)
 
         elif key_type == "running":
             # หยิบ 1 ตัวจากถังวิน
-            return secrets.choice(self.win_pool)
-            
+            return self.rng.choice(self.win_pool)
+
         else:
             # กรณีอื่นๆ สุ่มเลข 2 หัก (00-99)
-            return str(secrets.randbelow(100)).zfill(2)
\ No newline at end of file
+            return str(self.rng.randrange(100)).zfill(2)
@@ -1,20 +1,32 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Query
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Response, Header
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database import supabase 
+from database import supabase, db
 from schemas import (
     GenerateRequest, GenerateResponse, TemplateCreate, UploadResponse, 
     UserLogin, UserCreate, UserUpdate, GlobalConfigUpdate, GlobalConfigResponse,
     LotteryUpdate, LotteryCreate
 )
-from logic import LotteryLogic
+from logic import LotteryLogic, KeyedRandom, derive_key
+from generation_log import GenerationLogger
+from cache import TTLCache, CacheRegistry
+from invalidation import InvalidationBus, PostgresNotifyTransport
+from resilience import CircuitOpenError
+from admission import AdmissionController, AdmissionMiddleware, budget_from_env
+from warmup import WarmupJob
+from profiling import SamplingProfiler, ProfileStore, ProfiledRoute, RequestProfilerMiddleware, check_token
 from passlib.context import CryptContext
+from contextlib import asynccontextmanager
 
 from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import hashlib
+import threading
+import time
 
 load_dotenv()
 
@@ -60,7 +72,234 @@ def safe_verify_password(plain_password: str, hashed_password: str) -> bool:
     
     return False
 
-app = FastAPI()
+# 📝 Generation Log: บันทึกเลขที่ออกแบบ async (batch insert ลง generation_log)
+generation_logger = GenerationLogger(
+    supabase,
+    batch_size=int(os.getenv("GENERATION_LOG_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("GENERATION_LOG_FLUSH_INTERVAL", "2.0")),
+    max_queue=int(os.getenv("GENERATION_LOG_MAX_QUEUE", "10000")),
+    spill_path=os.getenv("GENERATION_LOG_SPILL_PATH", "generation_log.spill.jsonl"),
+    max_spill_bytes=int(float(os.getenv("GENERATION_LOG_MAX_SPILL_MB", "50")) * 1024 * 1024),
+)
+
+# 🗄️ Cache: TTL ตั้งยาวได้ เพราะมี change event คอย evict เมื่อข้อมูลเปลี่ยน
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+cache_registry = CacheRegistry()
+global_configs_cache = cache_registry.register(
+    TTLCache("global_configs", CACHE_TTL_SECONDS, keyed_by_id=False), ["global_configs"])
+template_cache = cache_registry.register(
+    TTLCache("templates", CACHE_TTL_SECONDS), ["templates"])
+latest_template_cache = cache_registry.register(
+    TTLCache("latest_template", CACHE_TTL_SECONDS, keyed_by_id=False), ["templates"])
+lottery_cache = cache_registry.register(
+    TTLCache("lotteries", CACHE_TTL_SECONDS), ["lotteries"])
+lottery_list_cache = cache_registry.register(
+    TTLCache("lottery_list", CACHE_TTL_SECONDS, keyed_by_id=False), ["lotteries", "templates"])
+user_template_cache = cache_registry.register(
+    TTLCache("user_templates", CACHE_TTL_SECONDS), ["users"])
+
+def create_invalidation_bus() -> InvalidationBus:
+    """ใช้ Postgres LISTEN/NOTIFY ถ้าตั้ง CACHE_INVALIDATION_DSN ไว้ ไม่งั้นใช้ in-memory (worker เดียว)"""
+    dsn = os.getenv("CACHE_INVALIDATION_DSN")
+    if dsn:
+        try:
+            return InvalidationBus(PostgresNotifyTransport(dsn))
+        except Exception as e:
+            print("Cache invalidation: fallback to in-memory transport -", e)
+    return InvalidationBus()
+
+invalidation_bus = create_invalidation_bus()
+invalidation_bus.subscribe(cache_registry.on_change)
+
+def fetch_global_configs() -> dict:
+    response = supabase.table("global_configs").select("*").execute()
+    return {item['key']: item['value'] for item in response.data}
+
+def fetch_template_full(template_id: str):
+    response = supabase.table("templates")\
+        .select("*, template_slots(*), template_backgrounds(*)")\
+        .eq("id", template_id)\
+        .single()\
+        .execute()
+    return response.data
+
+def fetch_latest_template_id():
+    """Template ที่ active ล่าสุด ใช้เป็น default เมื่อหวยไม่ได้ผูก template ไว้"""
+    latest_res = supabase.table("templates").select("id").eq("is_active", True).order("created_at", desc=True).limit(1).execute()
+    return latest_res.data[0]['id'] if latest_res.data else None
+
+def load_global_configs() -> dict:
+    """ดึงค่ากลางทั้งหมดเป็น dict {key: value} (ผ่าน cache)"""
+    return db.cached_read(global_configs_cache, "all", fetch_global_configs)
+
+def load_template_full(template_id: str):
+    """ดึง Template + Slots + Backgrounds (ผ่าน cache)"""
+    return db.cached_read(template_cache, str(template_id), lambda: fetch_template_full(template_id))
+
+# รหัส error เมื่อตาราง lottery_cards ยังไม่ถูกสร้าง (ยังไม่ได้รัน sql/003_lottery_cards.sql)
+MISSING_RELATION_CODES = {"42P01", "PGRST205"}
+
+def load_lottery_cards(search: str = None) -> list:
+    """
+    รายการหวยที่เปิดอยู่ เรียงตามเวลาปิดรับ (ถ้าไม่มีเอาไว้ท้ายสุด)
+    อ่านจาก lottery_cards (trigram index บน name) ด้วย query เดียว
+    ถ้ายังไม่ได้ migrate จะ fallback ไป join lotteries -> templates แบบเดิม
+    """
+    try:
+        query = supabase.table("lottery_cards").select("card").eq("is_active", True)
+        if search:
+            query = query.ilike("name", f"%{search}%")
+        response = query.order("closing_time", desc=False).execute()
+        return [row["card"] for row in response.data]
+    except Exception as e:
+        if getattr(e, "code", None) not in MISSING_RELATION_CODES:
+            raise
+
+    query = supabase.table("lotteries")\
+        .select("*, templates(background_url, base_width, base_height)")\
+        .eq("is_active", True)
+    if search:
+        query = query.ilike("name", f"%{search}%")
+    response = query.order("closing_time", desc=False).execute()
+    return response.data
+
+def service_unavailable(e: CircuitOpenError) -> HTTPException:
+    """ตอบ 503 + Retry-After ทันทีเมื่อ circuit breaker เปิดอยู่ (แทนการรอจน timeout แล้ว 500)"""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(int(e.retry_after) + 1)}
+    )
+
+# 🎲 Secret สำหรับโหมด deterministic (ห้ามเปลี่ยน ไม่งั้นชุดเลขเดิมจะ re-render ไม่ได้)
+LOTTERY_DRBG_SECRET = os.getenv("LOTTERY_DRBG_SECRET", "")
+MIN_DRBG_SECRET_BYTES = 32
+if LOTTERY_DRBG_SECRET and len(LOTTERY_DRBG_SECRET.encode("utf-8")) < MIN_DRBG_SECRET_BYTES:
+    # secret สั้นเดาได้ ใครก็คำนวณชุดเลขล่วงหน้าได้ ปิดโหมด deterministic แทน
+    print(f"⚠️  LOTTERY_DRBG_SECRET is shorter than {MIN_DRBG_SECRET_BYTES} bytes, deterministic mode disabled")
+    LOTTERY_DRBG_SECRET = ""
+# วันที่งวด default ตามเวลาท้องถิ่นของงวด (container เป็น UTC)
+LOTTERY_TIMEZONE = ZoneInfo(os.getenv("LOTTERY_TIMEZONE", "Asia/Bangkok"))
+
+def warm_up_caches(report, hold_seconds=None):
+    """
+    โหลดหวยที่เปิดอยู่ + template ที่ resolve แล้ว (รวม fallback template ล่าสุด) + global configs เข้า cache
+    เขียนทับ cache เดิมเสมอ เพื่อให้ค่าสดก่อนช่วงปิดรับ
+    hold_seconds: ให้ entry อยู่อย่างน้อยเท่านี้ (ถึงหลัง closing_time) ไม่หมดอายุกลางช่วงปิดรับ
+    การแก้ข้อมูลยัง evict ผ่าน InvalidationBus ตามปกติ
+    """
+    ttl = max(CACHE_TTL_SECONDS, hold_seconds) if hold_seconds else None
+    # generation ก่อนโหลด: ถ้ามี invalidate ระหว่าง warm-up จะไม่เขียนค่าเก่าทับ
+    lottery_gen = lottery_cache.generation()
+    latest_gen = latest_template_cache.generation()
+    lotteries = db.read(lambda: supabase.table("lotteries").select("*").eq("is_active", True).execute()).data or []
+    latest_template_id = db.read(fetch_latest_template_id)
+    template_ids = {str(l['template_id']) for l in lotteries if l.get('template_id')}
+    if latest_template_id:
+        template_ids.add(str(latest_template_id))
+
+    # global configs + listing + lotteries + templates
+    total = 2 + len(lotteries) + len(template_ids)
+    done = 0
+    report(done, total)
+
+    gen = global_configs_cache.generation()
+    global_configs_cache.set("all", db.read(fetch_global_configs), generation=gen, ttl=ttl)
+    gen = lottery_list_cache.generation()
+    lottery_list_cache.set("", db.read(load_lottery_cards), generation=gen, ttl=ttl)
+    if latest_template_id:
+        latest_template_cache.set("latest", latest_template_id, generation=latest_gen, ttl=ttl)
+    done += 2
+    report(done, total)
+
+    for lottery in lotteries:
+        lottery_cache.set(str(lottery['id']), lottery, generation=lottery_gen, ttl=ttl)
+        done += 1
+    report(done, total)
+
+    for template_id in template_ids:
+        try:
+            gen = template_cache.generation()
+            template = db.read(lambda: fetch_template_full(template_id))
+            if template:
+                template_cache.set(template_id, template, generation=gen, ttl=ttl)
+        except Exception as e:
+            print(f"Warm-up: template {template_id} skipped -", e)
+        done += 1
+        report(done, total)
+
+def fetch_next_closing_time():
+    """closing_time ที่ใกล้ที่สุดในอนาคตของหวยที่เปิดอยู่"""
+    now = datetime.now(timezone.utc)
+    res = db.read(lambda: supabase.table("lotteries")\
+        .select("closing_time")\
+        .eq("is_active", True)\
+        .gt("closing_time", now.isoformat())\
+        .order("closing_time", desc=False)\
+        .limit(1)\
+        .execute())
+    if not res.data or not res.data[0].get('closing_time'):
+        return None
+    closing = datetime.fromisoformat(res.data[0]['closing_time'])
+    return closing if closing.tzinfo else closing.replace(tzinfo=timezone.utc)
+
+# 🔥 Warm-up: โหลด cache ตอน startup และก่อน closing_time ที่ใกล้ที่สุด
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+warmup_job = WarmupJob(
+    warm_up_caches,
+    fetch_next_closing_time,
+    lead_minutes=float(os.getenv("WARMUP_LEAD_MINUTES", "10")),
+    recheck_seconds=float(os.getenv("WARMUP_RECHECK_MINUTES", "30")) * 60,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    generation_logger.start()
+    if WARMUP_ENABLED:
+        warmup_job.start()
+    yield
+    warmup_job.stop()
+    generation_logger.stop()
+    invalidation_bus.close()
+
+app = FastAPI(lifespan=lifespan)
+# ให้ profile ราย request เก็บเฉพาะ thread ที่รัน handler ของ request นั้น
+app.router.route_class = ProfiledRoute
+
+# 🔬 Profiling: เปิดเมื่อตั้ง PROFILING_TOKEN เท่านั้น (ส่ง token มาใน header)
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL_MS", "10")) / 1000
+profile_store = ProfileStore()
+profile_lock = threading.Lock()
+
+# Profile ราย request: ส่ง header "X-Profile: <PROFILING_TOKEN>" แล้วดูผลจาก X-Profile-Id
+app.add_middleware(RequestProfilerMiddleware, token=PROFILING_TOKEN, store=profile_store,
+                   interval=min(PROFILING_INTERVAL, 0.005))
+
+# 🚦 Admission Control: จำกัด rate ต่อ client และ concurrency ต่อ route (ตอบ 429/503 + Retry-After)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0"))
+# จำนวน proxy หน้า app ที่เติม X-Forwarded-For (Cloud Run = 1) ถ้า 0 จะใช้ IP ที่ต่อเข้ามาตรงๆ
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+admission_controller = AdmissionController([
+    ("POST", "/api/generate", False, budget_from_env(
+        "generate", "ADMISSION_GENERATE",
+        {"rate": 5, "burst": 20, "concurrency": 8, "queue": 32}, ADMISSION_QUEUE_TIMEOUT)),
+    # Login มี budget แยก งาน bcrypt จะได้ไม่แย่ง worker ของ generate
+    # และจำกัดการ login ผิดต่อ (IP, username) กันเดารหัสของ user คนเดียว
+    ("POST", "/api/login", False, budget_from_env(
+        "login", "ADMISSION_LOGIN",
+        {"rate": 0.5, "burst": 5, "concurrency": 2, "queue": 8}, ADMISSION_QUEUE_TIMEOUT,
+        user_field="username", user_env_var="ADMISSION_LOGIN_USER",
+        user_defaults={"rate": 0.05, "burst": 10})),
+    ("GET", "/api/lotteries", True, budget_from_env(
+        "lotteries", "ADMISSION_LOTTERIES",
+        {"rate": 10, "burst": 30, "concurrency": 16, "queue": 64}, ADMISSION_QUEUE_TIMEOUT)),
+])
+
+# ต้อง add ก่อน CORS เพื่อให้ CORS อยู่ชั้นนอกสุด (429/503 จะได้มี CORS headers)
+app.add_middleware(AdmissionMiddleware, controller=admission_controller, trusted_proxies=TRUSTED_PROXY_COUNT)
 
 # 🔓 เปิด CORS ให้ Frontend เข้าถึงได้ (ระบุ Domain ชัดเจนเพื่อความปลอดภัย)
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173").split(",")
@@ -78,20 +317,32 @@ def read_root():
     return {"message": "Lottery API is running! 🚀"}
 
 @app.get("/health")
-def health_check():
-    """Health check endpoint สำหรับ monitoring"""
+def health_check(response: Response):
+    """Health check endpoint สำหรับ monitoring (ตอบ 503 ระหว่าง warm-up รอบแรก)"""
+    status = "healthy"
+    if WARMUP_ENABLED and not warmup_job.ready:
+        status = "warming"
+        response.status_code = 503
+    elif WARMUP_ENABLED and warmup_job.state == WarmupJob.FAILED:
+        status = "degraded"
+
     return {
-        "status": "healthy",
+        "status": status,
         "timestamp": datetime.now().isoformat(),
-        "service": "lottery-api"
+        "service": "lottery-api",
+        "generation_log": generation_logger.stats(),
+        "cache": cache_registry.stats(),
+        "cache_invalidation": invalidation_bus.stats(),
+        "supabase": db.stats(),
+        "admission": admission_controller.stats(),
+        "warmup": warmup_job.status()
     }
 
 @app.get("/api/global-configs", response_model=GlobalConfigResponse)
 def get_global_configs():
     """ดึงค่ากลาง (QR Code, Line ID) - เปิด Public ให้ Frontend ดึงไปโชว์ได้"""
     try:
-        response = supabase.table("global_configs").select("*").execute()
-        configs = {item['key']: item['value'] for item in response.data}
+        configs = load_global_configs()
         return {
             "qr_code_url": configs.get("qr_code_url", ""),
             "line_id": configs.get("line_id", "")
@@ -108,6 +359,7 @@ def update_global_configs(config: GlobalConfigUpdate):
             supabase.table("global_configs").upsert({"key": "qr_code_url", "value": config.qr_code_url}).execute()
         if config.line_id is not None:
             supabase.table("global_configs").upsert({"key": "line_id", "value": config.line_id}).execute()
+        invalidation_bus.publish("global_configs")
         return {"message": "Updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -118,16 +370,24 @@ def generate_numbers(request: GenerateRequest):
     API หลัก: รับ Template + Seed -> ส่งเลขชุดกลับไป
     รวมถึงเติมค่า Global Configs (QR Code, Line ID) อัตโนมัติ
     """
+    if request.deterministic and not LOTTERY_DRBG_SECRET:
+        raise HTTPException(status_code=400, detail="Deterministic mode is not configured")
+
     try:
         # 1. เรียกใช้ Logic Engine
-        engine = LotteryLogic(seed=request.user_seed)
+        draw_date = None
+        if request.deterministic:
+            # ชุดเลขคำนวณซ้ำได้จาก (secret, seed, วันที่งวด, template) ไม่ต้องเก็บ state
+            draw_date = (request.draw_date or datetime.now(LOTTERY_TIMEZONE).date()).isoformat()
+            key = derive_key(LOTTERY_DRBG_SECRET, request.user_seed, draw_date, request.template_id)
+            engine = LotteryLogic(seed=request.user_seed, rng=KeyedRandom(key))
+        else:
+            engine = LotteryLogic(seed=request.user_seed)
         
         # 2. เตรียม Global Configs
         global_data = {}
         try:
-            g_res = supabase.table("global_configs").select("*").execute()
-            for item in g_res.data:
-                global_data[item['key']] = item['value']
+            global_data = load_global_configs()
         except:
             pass
 
@@ -154,7 +414,11 @@ def generate_numbers(request: GenerateRequest):
                 if slot_id:
                     results[slot_id] = global_data.get("line_id", "")
 
-        return {"results": results}
+        # 4. บันทึกประวัติการออกเลข (enqueue เฉยๆ ไม่รอ database)
+        generation_logger.log(request.template_id, request.user_seed, results,
+                              draw_date=draw_date, deterministic=request.deterministic)
+
+        return {"results": results, "draw_date": draw_date}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -166,8 +430,10 @@ def get_templates():
     """
     try:
         # ดึงข้อมูลจากตาราง templates เรียงตามล่าสุด
-        response = supabase.table("templates").select("*").order("created_at", desc=True).execute()
+        response = db.read(lambda: supabase.table("templates").select("*").order("created_at", desc=True).execute())
         return response.data
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -178,16 +444,14 @@ def get_template(template_id: str):
     """
     try:
         # ใช้ Supabase Join ตาราง templates กับ template_slots และ template_backgrounds
-        response = supabase.table("templates")\
-            .select("*, template_slots(*), template_backgrounds(*)")\
-            .eq("id", template_id)\
-            .single()\
-            .execute()
+        template = load_template_full(template_id)
             
-        if not response.data:
+        if not template:
             raise HTTPException(status_code=404, detail="Template not found")
             
-        return response.data
+        return template
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -242,6 +506,7 @@ def create_template(request: TemplateCreate):
                 })
             supabase.table("template_backgrounds").insert(backgrounds_data).execute()
 
+        invalidation_bus.publish("templates", new_template_id)
         return {"message": "Saved successfully!", "id": new_template_id}
 
     except Exception as e:
@@ -300,6 +565,7 @@ def update_template(template_id: str, request: TemplateCreate):
                 })
             supabase.table("template_backgrounds").insert(backgrounds_data).execute()
 
+        invalidation_bus.publish("templates", template_id)
         return {"message": "Updated successfully!"}
 
     except Exception as e:
@@ -317,6 +583,7 @@ def delete_template(template_id: str):
         if not res.data:
              raise HTTPException(status_code=404, detail="Template not found")
 
+        invalidation_bus.publish("templates", template_id)
         return {"message": "Deleted successfully"}
 
     except Exception as e:
@@ -355,16 +622,12 @@ def get_lotteries(search: str = Query(None)):
     ดึงรายชื่อหวยทั้งหมด พร้อม Sorting และ Search
     """
     try:
-        query = supabase.table("lotteries")\
-            .select("*, templates(background_url, base_width, base_height)")\
-            .eq("is_active", True)
-            
+        # cache เฉพาะรายการทั้งหมด คำค้นมาจากผู้ใช้ (cache ไว้จะโตไม่จำกัด) ให้วิ่ง indexed query ตรงๆ
         if search:
-            query = query.ilike("name", f"%{search}%")
-            
-        # เรียงตามเวลาปิดรับ (ถ้ามี) ถ้าไม่มีเอาไว้ท้ายสุด
-        response = query.order("closing_time", desc=False).execute()
-        return response.data
+            return db.read(lambda: load_lottery_cards(search))
+        return db.cached_read(lottery_list_cache, "", load_lottery_cards)
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -374,19 +637,26 @@ def get_lottery_details(lottery_id: str, user_id: str = None):
     ดึงข้อมูลหวย 1 ตัว + Template (Override by User, Fallback by Lottery, Fallback by System)
     """
     try:
-        lottery_res = supabase.table("lotteries").select("*").eq("id", lottery_id).single().execute()
-        if not lottery_res.data:
+        lottery = db.cached_read(
+            lottery_cache,
+            lottery_id,
+            lambda: supabase.table("lotteries").select("*").eq("id", lottery_id).single().execute().data
+        )
+        if not lottery:
             raise HTTPException(status_code=404, detail="Lottery not found")
         
-        lottery = lottery_res.data
         target_template_id = None
 
         # 1. Priority: User Template
         if user_id:
             try:
-                user_res = supabase.table("users").select("assigned_template_id").eq("id", user_id).single().execute()
-                if user_res.data and user_res.data.get('assigned_template_id'):
-                    target_template_id = user_res.data['assigned_template_id']
+                user_row = db.cached_read(
+                    user_template_cache,
+                    user_id,
+                    lambda: supabase.table("users").select("assigned_template_id").eq("id", user_id).single().execute().data
+                )
+                if user_row and user_row.get('assigned_template_id'):
+                    target_template_id = user_row['assigned_template_id']
             except Exception:
                 pass
 
@@ -397,9 +667,7 @@ def get_lottery_details(lottery_id: str, user_id: str = None):
         # 3. Priority: System Default (Last Active Template)
         if not target_template_id:
             try:
-                latest_res = supabase.table("templates").select("id").eq("is_active", True).order("created_at", desc=True).limit(1).execute()
-                if latest_res.data:
-                    target_template_id = latest_res.data[0]['id']
+                target_template_id = db.cached_read(latest_template_cache, "latest", fetch_latest_template_id)
             except Exception:
                 pass
 
@@ -409,25 +677,23 @@ def get_lottery_details(lottery_id: str, user_id: str = None):
 
         # ดึงข้อมูล Template + Slots + Backgrounds
         try:
-            template_res = supabase.table("templates")\
-                .select("*, template_slots(*), template_backgrounds(*)")\
-                .eq("id", target_template_id)\
-                .single()\
-                .execute()
+            template = load_template_full(target_template_id)
         except Exception:
              return {"lottery": lottery, "template": None}
 
-        if not template_res.data:
+        if not template:
              return {"lottery": lottery, "template": None}
 
         return {
             "lottery": lottery,
-            "template": template_res.data,
+            "template": template,
             "used_template_id": target_template_id
         }
 
     except HTTPException as he:
         raise he 
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         print("System Error:", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -450,6 +716,7 @@ def update_lottery(lottery_id: str, request: LotteryUpdate):
             return {"message": "Nothing to update"}
 
         supabase.table("lotteries").update(update_data).eq("id", lottery_id).execute()
+        invalidation_bus.publish("lotteries", lottery_id)
         return {"message": "Lottery updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -464,6 +731,7 @@ def create_lottery(request: LotteryCreate):
             "is_active": request.is_active
         }
         res = supabase.table("lotteries").insert(data).execute()
+        invalidation_bus.publish("lotteries", res.data[0]['id'] if res.data else None)
         return {"message": "Lottery created successfully", "data": res.data}
     except Exception as e:
         if "unique constraint" in str(e).lower() or "duplicate" in str(e).lower():
@@ -474,20 +742,70 @@ def create_lottery(request: LotteryCreate):
 def delete_lottery(lottery_id: str):
     try:
         supabase.table("lotteries").delete().eq("id", lottery_id).execute()
+        invalidation_bus.publish("lotteries", lottery_id)
         return {"message": "Lottery deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Profiling APIs (Admin) ---
+
+def require_profiling_token(token: str):
+    if not PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not check_token(PROFILING_TOKEN, token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+def profile_response(profiler: SamplingProfiler, fmt: str):
+    if fmt == "collapsed":
+        return PlainTextResponse(profiler.to_collapsed())
+    return profiler.to_speedscope()
+
+@app.get("/api/admin/profile")
+def capture_profile(
+    seconds: float = Query(10, gt=0),
+    fmt: str = Query("speedscope", alias="format", pattern="^(speedscope|collapsed)$"),
+    x_profile_token: str = Header(None)
+):
+    """
+    เก็บ sampling profile ของทุก thread เป็นเวลา N วินาที
+    format=speedscope (เปิดที่ speedscope.app) หรือ collapsed (flamegraph.pl)
+    """
+    require_profiling_token(x_profile_token)
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Profiling session already running")
+    try:
+        # ไม่เก็บ thread ของ endpoint นี้เอง (มันแค่ sleep รอ)
+        profiler = SamplingProfiler(interval=PROFILING_INTERVAL, exclude_threads={threading.get_ident()})
+        profiler.start()
+        time.sleep(min(seconds, PROFILING_MAX_SECONDS))
+        profiler.stop()
+    finally:
+        profile_lock.release()
+    return profile_response(profiler, fmt)
+
+@app.get("/api/admin/profile/requests/{profile_id}")
+def get_request_profile(
+    profile_id: str,
+    fmt: str = Query("speedscope", alias="format", pattern="^(speedscope|collapsed)$"),
+    x_profile_token: str = Header(None)
+):
+    """ดึงผล profile ของ request ที่ส่ง header X-Profile มา (id จาก response header X-Profile-Id)"""
+    require_profiling_token(x_profile_token)
+    profiler = profile_store.get(profile_id)
+    if not profiler:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile_response(profiler, fmt)
+
 # --- User Management APIs ---
 
 @app.post("/api/login")
 def login(request: UserLogin):
     try:
-        user = supabase.table("users")\
+        user = db.read(lambda: supabase.table("users")\
             .select("*")\
             .eq("username", request.username)\
             .single()\
-            .execute()
+            .execute())
             
         if not user.data:
             raise HTTPException(status_code=401, detail="ชื่อผู้ใช้หรือรหัสผ่านไม่ถูกต้อง")
@@ -500,6 +818,8 @@ def login(request: UserLogin):
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         print(f"Login Error: {e}")
         raise HTTPException(status_code=401, detail="Login failed")
@@ -507,18 +827,22 @@ def login(request: UserLogin):
 @app.get("/api/users")
 def get_users():
     try:
-        res = supabase.table("users").select("*").order("created_at", desc=True).execute()
+        res = db.read(lambda: supabase.table("users").select("*").order("created_at", desc=True).execute())
         return res.data
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/users/{user_id}")
 def get_user(user_id: str):
     try:
-        res = supabase.table("users").select("*").eq("id", user_id).single().execute()
+        res = db.read(lambda: supabase.table("users").select("*").eq("id", user_id).single().execute())
         if not res.data:
             raise HTTPException(status_code=404, detail="User not found")
         return res.data
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -536,6 +860,7 @@ def create_user(request: UserCreate):
             "allowed_template_ids": request.allowed_template_ids
         }
         supabase.table("users").insert(user_data).execute()
+        invalidation_bus.publish("users")
         return {"message": "User created successfully"}
     except Exception as e:
         if "unique constraint" in str(e).lower() or "duplicate" in str(e).lower():
@@ -559,6 +884,7 @@ def update_user(user_id: str, request: UserUpdate):
             return {"message": "Nothing to update"}
 
         supabase.table("users").update(update_data).eq("id", user_id).execute()
+        invalidation_bus.publish("users", user_id)
         return {"message": "User updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -567,6 +893,7 @@ def update_user(user_id: str, request: UserUpdate):
 def delete_user(user_id: str):
     try:
         supabase.table("users").delete().eq("id", user_id).execute()
+        invalidation_bus.publish("users", user_id)
         return {"message": "User deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -6,11 +6,32 @@ Migration Script: Hash existing plain-text passwords in the database
 1. ตรวจสอบว่าตั้งค่า .env ถูกต้อง (SUPABASE_URL, SUPABASE_KEY)
 2. รันคำสั่ง: python migrate_passwords.py
 3. สคริปต์จะ hash password ทุกตัวที่ยังเป็น plain text
+
+การทำงาน:
+- ดึง users ทีละหน้า (keyset pagination ตาม id) แทนการ select ทั้งตาราง
+- Hash ด้วย process pool ใช้ทุก core (bcrypt เป็นงาน CPU ล้วน)
+- เขียนกลับเฉพาะ password ทีละ row ด้วย thread pool เล็กๆ
+  โดยมีเงื่อนไขว่า password ยังเป็นค่าเดิม (ถ้า user ถูกลบ/เปลี่ยน password ระหว่างรันจะไม่เขียนทับ)
+- บันทึก checkpoint (id ล่าสุดที่เสร็จ) ลงไฟล์ ถ้าสคริปต์ล้มกลางทาง รันใหม่จะทำต่อจากเดิม
+
+ตัวเลือก:
+    --dry-run          hash แต่ไม่เขียนลง database และไม่บันทึก checkpoint (ใช้วัด throughput)
+    --page-size N      จำนวน users ต่อหน้า (default: 500)
+    --workers N        จำนวน process (default: จำนวน CPU)
+    --write-workers N  จำนวน thread ที่เขียนกลับ database (default: 8)
+    --checkpoint PATH  ไฟล์ checkpoint (default: .migrate_passwords.checkpoint.json)
+    --restart          ไม่สนใจ checkpoint เดิม เริ่มใหม่ตั้งแต่ต้น
+    --yes              ไม่ต้องถามยืนยัน
 """
 
 from database import supabase
 from passlib.context import CryptContext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import json
+import os
 import sys
+import time
 import hashlib
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -37,81 +58,179 @@ def safe_hash_password(password: str) -> str:
         # ถ้าไม่เกิน 72 bytes ก็ hash ตรงๆ
         return pwd_context.hash(password)
 
-def migrate_passwords():
+def hash_row(row: dict):
+    """
+    งานที่รันใน worker process: คืน (row, hashed_password, error)
+    hashed_password เป็น None ถ้า hash อยู่แล้ว (ข้าม) หรือ hash ไม่สำเร็จ (มี error)
+    """
+    password = row.get('password')
+    if not isinstance(password, str):
+        # NULL / ชนิดอื่น: นับเป็น error ของ user นี้ ไม่ hash ค่าว่างแล้วเขียนทับ
+        return row, None, f"password is not a string ({type(password).__name__})"
+    if is_hashed(password):
+        return row, None, None
+    try:
+        return row, safe_hash_password(password), None
+    except Exception as e:
+        return row, None, str(e)
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # เขียนไฟล์ชั่วคราวแล้ว rename เพื่อไม่ให้ checkpoint เสียถ้าล้มระหว่างเขียน
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def fetch_page(last_id, page_size: int) -> list:
+    query = supabase.table("users").select("id, username, password").order("id", desc=False).limit(page_size)
+    if last_id is not None:
+        query = query.gt("id", last_id)
+    return query.execute().data or []
+
+def write_password(item):
+    """
+    อัปเดตเฉพาะ password ของ user 1 คน โดยต้องยังเป็น plain text เดิมอยู่
+    คืน (row, updated, error) - updated=False แปลว่า user ถูกลบหรือเปลี่ยน password ไปแล้วระหว่างรัน
+    """
+    row, hashed_password = item
+    try:
+        res = supabase.table("users")\
+            .update({"password": hashed_password})\
+            .eq("id", row['id'])\
+            .eq("password", row['password'])\
+            .execute()
+        return row, bool(res.data), None
+    except Exception as e:
+        return row, False, str(e)
+
+def migrate_passwords(page_size: int = 500, workers: int = None, checkpoint_path: str = ".migrate_passwords.checkpoint.json",
+                      dry_run: bool = False, restart: bool = False, write_workers: int = 8):
     """แปลง plain text passwords เป็น hashed passwords"""
     print("🔍 กำลังค้นหา users ที่มี plain text password...")
-    
+
+    checkpoint = {} if restart or dry_run else load_checkpoint(checkpoint_path)
+    last_id = checkpoint.get("last_id")
+    updated_count = checkpoint.get("updated", 0)
+    skipped_count = checkpoint.get("skipped", 0)
+    changed_count = checkpoint.get("changed", 0)
+    error_count = checkpoint.get("errors", 0)
+    if last_id is not None:
+        print(f"↩️  ทำต่อจาก checkpoint (id > {last_id}, อัพเดตไปแล้ว {updated_count} users)")
+
+    workers = workers or os.cpu_count() or 1
+    processed = 0
+    hashed_this_run = 0
+    started = time.perf_counter()
+
     try:
-        # ดึง users ทั้งหมด
-        response = supabase.table("users").select("*").execute()
-        users = response.data
-        
-        if not users:
-            print("❌ ไม่พบ users ในระบบ")
-            return
-        
-        print(f"✅ พบ {len(users)} users")
-        
-        updated_count = 0
-        skipped_count = 0
-        error_count = 0
-        
-        for user in users:
-            user_id = user['id']
-            username = user['username']
-            password = user['password']
-            
-            try:
-                # เช็คว่า hash แล้วหรือยัง
-                if is_hashed(password):
-                    print(f"⏭️  {username}: Password ถูก hash แล้ว (ข้าม)")
-                    skipped_count += 1
-                    continue
-                
-                # ตรวจสอบความยาว password
-                password_bytes = password.encode('utf-8')
-                if len(password_bytes) > 72:
-                    print(f"⚠️  {username}: Password ยาว {len(password_bytes)} bytes (เกิน 72) - จะใช้ SHA256+bcrypt")
-                
-                # Hash password
-                hashed_password = safe_hash_password(password)
-                
-                # Update ใน database
-                supabase.table("users").update({
-                    "password": hashed_password
-                }).eq("id", user_id).execute()
-                
-                print(f"✅ {username}: Password ถูก hash เรียบร้อย")
-                updated_count += 1
-                
-            except Exception as user_error:
-                print(f"❌ {username}: เกิดข้อผิดพลาด - {str(user_error)}")
-                error_count += 1
-                continue
-        
+        with ProcessPoolExecutor(max_workers=workers) as pool, \
+                ThreadPoolExecutor(max_workers=write_workers) as writer:
+            while True:
+                users = fetch_page(last_id, page_size)
+                if not users:
+                    break
+
+                batch = []
+                chunksize = max(1, len(users) // (workers * 4))
+                for row, hashed_password, error in pool.map(hash_row, users, chunksize=chunksize):
+                    username = row['username']
+                    if error:
+                        print(f"❌ {username}: เกิดข้อผิดพลาด - {error}")
+                        error_count += 1
+                    elif hashed_password is None:
+                        skipped_count += 1
+                    else:
+                        if len(row['password'].encode('utf-8')) > 72:
+                            print(f"⚠️  {username}: Password ยาวเกิน 72 bytes - ใช้ SHA256+bcrypt")
+                        batch.append((row, hashed_password))
+
+                hashed_this_run += len(batch)
+                if dry_run:
+                    updated_count += len(batch)
+                else:
+                    for row, updated, error in writer.map(write_password, batch):
+                        if error:
+                            print(f"❌ {row['username']}: เขียนกลับไม่สำเร็จ - {error}")
+                            error_count += 1
+                        elif updated:
+                            updated_count += 1
+                        else:
+                            print(f"⏭️  {row['username']}: ถูกลบหรือเปลี่ยน password ระหว่างรัน (ไม่เขียนทับ)")
+                            changed_count += 1
+                processed += len(users)
+                last_id = users[-1]['id']
+
+                if not dry_run:
+                    save_checkpoint(checkpoint_path, {
+                        "last_id": last_id,
+                        "updated": updated_count,
+                        "skipped": skipped_count,
+                        "changed": changed_count,
+                        "errors": error_count,
+                    })
+
+                elapsed = time.perf_counter() - started
+                print(f"📦 ประมวลผลแล้ว {processed} users ({hashed_this_run / elapsed:.1f} hashes/s)")
+
+        elapsed = time.perf_counter() - started
         print("\n" + "="*50)
-        print(f"🎉 Migration เสร็จสิ้น!")
+        print(f"🎉 Migration เสร็จสิ้น!" + (" (DRY RUN - ไม่ได้เขียนลง database)" if dry_run else ""))
         print(f"   - อัพเดต: {updated_count} users")
         print(f"   - ข้าม: {skipped_count} users (hash อยู่แล้ว)")
+        if changed_count > 0:
+            print(f"   - ข้าม: {changed_count} users (ถูกลบ/เปลี่ยน password ระหว่างรัน)")
         if error_count > 0:
             print(f"   - ❌ ล้มเหลว: {error_count} users")
+        print(f"   - ⏱️  {processed} users ใน {elapsed:.1f}s ด้วย {workers} processes")
+        if elapsed > 0:
+            print(f"   - 🚀 Throughput: {hashed_this_run / elapsed:.1f} hashes/s, {processed / elapsed:.1f} users/s")
         print("="*50)
-        
+
+        # เสร็จครบแล้ว ลบ checkpoint เพื่อให้รอบถัดไปเริ่มใหม่
+        if not dry_run and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
     except Exception as e:
         print(f"❌ เกิดข้อผิดพลาดร้ายแรง: {str(e)}")
+        if not dry_run:
+            print(f"💾 Checkpoint ถูกบันทึกไว้ที่ {checkpoint_path} รันใหม่เพื่อทำต่อ")
         import traceback
         traceback.print_exc()
         sys.exit(1)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash plain-text passwords in the users table")
+    parser.add_argument("--dry-run", action="store_true", help="hash แต่ไม่เขียนลง database (วัด throughput)")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--write-workers", type=int, default=8)
+    parser.add_argument("--checkpoint", default=".migrate_passwords.checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="เริ่มใหม่ตั้งแต่ต้น ไม่สนใจ checkpoint")
+    parser.add_argument("--yes", action="store_true", help="ไม่ต้องถามยืนยัน")
+    args = parser.parse_args()
+
     print("="*50)
     print("🔐 Password Migration Script")
     print("="*50)
-    
-    confirm = input("\n⚠️  คำเตือน: สคริปต์นี้จะแก้ไข passwords ใน database\nต้องการดำเนินการต่อหรือไม่? (yes/no): ")
-    
-    if confirm.lower() not in ['yes', 'y']:
-        print("❌ ยกเลิกการทำงาน")
-        sys.exit(0)
-    
-    migrate_passwords()
+
+    if not args.dry_run and not args.yes:
+        confirm = input("\n⚠️  คำเตือน: สคริปต์นี้จะแก้ไข passwords ใน database\nต้องการดำเนินการต่อหรือไม่? (yes/no): ")
+
+        if confirm.lower() not in ['yes', 'y']:
+            print("❌ ยกเลิกการทำงาน")
+            sys.exit(0)
+
+    migrate_passwords(
+        page_size=args.page_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run,
+        restart=args.restart,
+        write_workers=args.write_workers,
+    )
@@ -0,0 +1,242 @@
+"""
+Sampling Profiler สำหรับวิเคราะห์ latency ใน production
+
+- เก็บ stack ของทุก thread ด้วย sys._current_frames() ทุก interval (default 10ms)
+  ไม่ต้อง instrument โค้ด overhead ต่ำพอจะเปิดสั้นๆ บน production ได้
+- ส่งออกเป็น speedscope JSON (เปิดที่ https://www.speedscope.app) หรือ collapsed stacks (flamegraph.pl)
+- RequestProfilerMiddleware: profile เฉพาะ request ที่ส่ง header X-Profile มา
+  ผลลัพธ์เก็บไว้ในหน่วยความจำ ดึงได้จาก id ใน response header X-Profile-Id
+
+การ profile ราย request เก็บเฉพาะ thread ของ request นั้น: ProfiledRoute ห่อ sync handler
+ให้บอก thread ที่ตัวเองรันอยู่กับ profiler ใน contextvar (run_in_threadpool copy context มาให้)
+รวมกับ thread ของ event loop (ส่วน async ของ request อื่นที่วิ่งพร้อมกันยังปนมาได้ในส่วนนี้)
+"""
+
+import asyncio
+import contextvars
+import functools
+import hmac
+import inspect
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+Frame = Tuple[str, str, int]  # (function, file, line)
+
+# leaf frame ที่บอกว่า thread กำลังรอเฉยๆ (ไม่นับเป็นงาน)
+_IDLE_LEAVES = {
+    ("wait", "threading.py"),
+    ("_wait_for_tstate_lock", "threading.py"),
+    ("select", "selectors.py"),
+    ("get", "queue.py"),
+    ("_worker", "thread.py"),
+    ("accept", "socket.py"),
+}
+
+
+def _is_idle(stack: Tuple[Frame, ...]) -> bool:
+    if not stack:
+        return True
+    func, filename, _ = stack[-1]
+    return (func, os.path.basename(filename)) in _IDLE_LEAVES
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, include_idle: bool = False, exclude_threads: Optional[set] = None,
+                 include_threads: Optional[set] = None):
+        """include_threads=None -> ทุก thread, ถ้าเป็น set จะเก็บเฉพาะ thread ในนั้น (เพิ่มระหว่างทางด้วย include_thread)"""
+        self.interval = interval
+        self.include_idle = include_idle
+        self.exclude_threads = set(exclude_threads or ())
+        self.include_threads = None if include_threads is None else set(include_threads)
+        # (thread name, stack root->leaf) -> จำนวน sample
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def include_thread(self, ident: int):
+        if self.include_threads is not None:
+            self.include_threads.add(ident)
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        skip = self.exclude_threads | {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in skip or (self.include_threads is not None and ident not in self.include_threads):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                stack = tuple(reversed(stack))
+                if not self.include_idle and _is_idle(stack):
+                    continue
+                self.samples[(names.get(ident, str(ident)), stack)] += 1
+            self.sample_count += 1
+
+    # ---------- Export ----------
+
+    def to_collapsed(self) -> str:
+        """รูปแบบ "thread;func (file:line);... count" ใช้กับ flamegraph.pl / speedscope ได้"""
+        lines = []
+        for (thread_name, stack), count in self.samples.most_common():
+            frames = [thread_name] + [f"{func} ({os.path.basename(f)}:{line})" for func, f, line in stack]
+            lines.append(";".join(frames) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "lottery-api") -> Dict[str, Any]:
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Frame, int] = {}
+        profiles: Dict[str, Dict[str, Any]] = {}
+
+        for (thread_name, stack), count in self.samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    func, filename, line = frame
+                    frames.append({"name": func, "file": filename, "line": line})
+                indexes.append(frame_index[frame])
+
+            profile = profiles.setdefault(thread_name, {
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(self.duration, 6),
+                "samples": [],
+                "weights": [],
+            })
+            profile["samples"].append(indexes)
+            profile["weights"].append(round(count * self.interval, 6))
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "lottery-api sampling profiler",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+
+class ProfileStore:
+    """เก็บผล profile ราย request ล่าสุดไว้จำนวนจำกัด"""
+
+    def __init__(self, max_items: int = 20):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, SamplingProfiler]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, profile_id: str, profiler: SamplingProfiler):
+        with self._lock:
+            self._items[profile_id] = profiler
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[SamplingProfiler]:
+        with self._lock:
+            return self._items.get(profile_id)
+
+
+# profiler ของ request ปัจจุบัน (ตั้งโดย RequestProfilerMiddleware)
+_active_profiler: contextvars.ContextVar = contextvars.ContextVar("active_profiler", default=None)
+
+
+def _record_thread(endpoint):
+    """ห่อ sync endpoint ให้บอก thread ที่รันอยู่กับ profiler ของ request (ถ้ามี)"""
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiler = _active_profiler.get()
+        if profiler is not None:
+            profiler.include_thread(threading.get_ident())
+        return endpoint(*args, **kwargs)
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Route ที่ให้ RequestProfilerMiddleware รู้ว่า sync handler รันบน thread ไหน
+    ใช้กับ app.router.route_class ก่อนประกาศ route
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _record_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def check_token(expected: str, provided: Optional[str]) -> bool:
+    # เทียบเป็น bytes: compare_digest กับ str ที่มีตัวอักษรนอก ASCII จะ raise TypeError
+    # header ถูก decode เป็น latin-1 จึง encode กลับด้วย latin-1 ได้ byte เดิมเสมอ
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(expected.encode("utf-8"), provided.encode("latin-1", errors="replace"))
+
+
+class RequestProfilerMiddleware:
+    """Profile request ที่มี header X-Profile ตรงกับ token แล้วตอบ X-Profile-Id กลับไป"""
+
+    def __init__(self, app, token: str, store: ProfileStore, interval: float = 0.005):
+        self.app = app
+        self.token = token
+        self.store = store
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.token:
+            return await self.app(scope, receive, send)
+
+        provided = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                provided = value.decode("latin-1")
+                break
+        if not check_token(self.token, provided):
+            return await self.app(scope, receive, send)
+
+        # thread ของ event loop (ส่วน async ของ request) + thread ที่ ProfiledRoute บอกมา
+        profiler = SamplingProfiler(interval=self.interval, include_threads={threading.get_ident()})
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        token = _active_profiler.set(profiler)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _active_profiler.reset(token)
+            # join sampler thread นอก event loop ไม่ให้บล็อก request อื่น
+            await asyncio.to_thread(profiler.stop)
+            self.store.put(profile_id, profiler)
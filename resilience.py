@@ -0,0 +1,248 @@
+"""
+Resilience layer รอบการเรียก Supabase
+
+- Retry แบบ exponential backoff + full jitter เฉพาะ read ที่ idempotent
+- Deadline ต่อ operation (รวมทุก retry) ส่งผ่าน contextvar ให้ httpx client
+  ตัด timeout ของแต่ละ attempt ไม่ให้เกินเวลาที่เหลือ (ดู DeadlineClient ใน database.py)
+- Circuit breaker: ถ้า error ชั่วคราวติดกันเกิน threshold จะเปิดวงจร
+  แล้วตอบเร็วจาก stale cache (ถ้ามี) หรือ CircuitOpenError แทนการรอ Supabase
+- FaultInjector: ตัวจำลอง latency / error สำหรับทดสอบในเครื่อง
+"""
+
+import contextvars
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from cache import MISSING, TTLCache
+
+try:
+    import httpx
+    _TRANSPORT_ERRORS = (httpx.TransportError,)
+except ImportError:  # pragma: no cover - httpx มากับ supabase เสมอ
+    _TRANSPORT_ERRORS = ()
+
+try:
+    from postgrest.exceptions import APIError
+except ImportError:  # pragma: no cover - postgrest มากับ supabase เสมอ
+    APIError = None
+
+# เวลา (time.monotonic) ที่ read ปัจจุบันต้องเสร็จ None = ไม่มี deadline
+_deadline: contextvars.ContextVar = contextvars.ContextVar("supabase_deadline", default=None)
+
+# APIError.code มาจาก JSON body ของ PostgREST (เป็น code ของ PostgREST/Postgres ไม่ใช่ HTTP status)
+# ยกเว้น body ไม่ใช่ JSON (เช่นหน้า 502/504 ของ gateway) ซึ่ง postgrest ใส่ HTTP status แทน
+_HTTP_5XX = re.compile(r"^5\d\d$")
+# PGRST000-003: ต่อ database ไม่ได้ / schema cache ยังไม่พร้อม (503)
+# 08xxx: connection exception, 53300: too_many_connections, 57014: statement timeout,
+# 57P01-57P03: database กำลัง shutdown / restart
+_TRANSIENT_PG_CODES = re.compile(r"^(PGRST00[0-3]|08[0-9A-Z]{3}|53300|57014|57P0[1-3])$")
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+class CircuitOpenError(Exception):
+    """วงจรเปิดอยู่ ไม่ส่ง request ไปยัง Supabase"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Database temporarily unavailable, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class InjectedFault(ConnectionError):
+    """Error ที่สร้างโดย FaultInjector"""
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Error ที่บอกว่า backend มีปัญหา (ควร retry / นับเข้า breaker)
+    รวม APIError ที่ code บอกว่า database ใช้ไม่ได้ชั่วคราว และ HTTP 5xx ที่ body ไม่ใช่ JSON
+    """
+    if isinstance(exc, _TRANSPORT_ERRORS + (TimeoutError, ConnectionError)):
+        return True
+    if APIError is not None and isinstance(exc, APIError):
+        code = str(getattr(exc, "code", "") or "")
+        return bool(_TRANSIENT_PG_CODES.match(code) or _HTTP_5XX.match(code))
+    return False
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self.rejected = 0
+        self._half_open_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """ถามก่อนส่ง request: HALF_OPEN ปล่อยผ่านทีละ 1 request เพื่อทดสอบ"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._half_open_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._half_open_in_flight:
+                    self.rejected += 1
+                    return False
+                self._half_open_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._half_open_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.open_count += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._half_open_in_flight = False
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "open_count": self.open_count,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+class ResilientExecutor:
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker] = None,
+        read_retries: int = 2,
+        read_deadline: float = 15.0,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.read_retries = read_retries
+        self.read_deadline = read_deadline
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.stale_served = 0
+        self.fault_injector: Optional["FaultInjector"] = None
+
+    def _attempt(self, fn: Callable[[], Any]) -> Any:
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.retry_after())
+        try:
+            if self.fault_injector:
+                self.fault_injector.before_call()
+            result = fn()
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                # Supabase ตอบกลับมาได้ (เช่น 404/validation) แปลว่า backend ยังปกติ
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def read(self, fn: Callable[[], Any], deadline: Optional[float] = None) -> Any:
+        """Read ที่ idempotent: retry error ชั่วคราวด้วย jittered backoff ภายใน deadline"""
+        deadline_at = time.monotonic() + (deadline if deadline is not None else self.read_deadline)
+        attempt = 0
+        while True:
+            token = _deadline.set(deadline_at)
+            try:
+                return self._attempt(fn)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.read_retries:
+                    raise
+                # Full jitter: สุ่มรอระหว่าง 0 ถึง backoff ของรอบนี้ กันทุก worker retry พร้อมกัน
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if time.monotonic() + delay >= deadline_at:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                self.retries += 1
+            finally:
+                _deadline.reset(token)
+
+    def cached_read(self, cache: TTLCache, key: Any, fn: Callable[[], Any], deadline: Optional[float] = None) -> Any:
+        """
+        อ่านผ่าน cache: fresh hit คืนทันที, miss ไปอ่าน Supabase
+        ถ้าวงจรเปิดหรือ Supabase ล่มชั่วคราว จะคืนค่า stale ใน cache แทน (ถ้ามี)
+        """
+        value = cache.get(key)
+        if value is not MISSING:
+            return value
+        generation = cache.generation()
+        try:
+            value = self.read(fn, deadline=deadline)
+        except Exception as e:
+            if not (isinstance(e, CircuitOpenError) or is_transient(e)):
+                raise
+            stale = cache.get_stale(key)
+            if stale is MISSING:
+                raise
+            self.stale_served += 1
+            return stale
+        # ไม่ cache ผลลัพธ์ว่าง (เช่น หา row ไม่เจอ) ให้ลองโหลดใหม่ครั้งหน้า
+        # และไม่ cache ถ้ามี invalidate เข้ามาระหว่างโหลด (ค่าที่ได้อาจเป็นค่าก่อนเขียน)
+        if value is not None:
+            cache.set(key, value, generation=generation)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "retries": self.retries,
+            "stale_served": self.stale_served,
+            "fault_injection": self.fault_injector.stats() if self.fault_injector else None,
+        }
+
+
+class FaultInjector:
+    """
+    จำลอง Supabase ที่ช้า/ล่ม สำหรับทดสอบในเครื่อง:
+        executor.fault_injector = FaultInjector(failure_rate=0.5, latency=0.2)
+    """
+
+    def __init__(self, failure_rate: float = 0.0, latency: float = 0.0, seed: Optional[int] = None):
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.injected = 0
+        self._rng = random.Random(seed)
+
+    def before_call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self._rng.random() < self.failure_rate:
+            self.injected += 1
+            raise InjectedFault("injected fault")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"failure_rate": self.failure_rate, "latency": self.latency, "injected": self.injected}
@@ -1,17 +1,20 @@
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, date
 
 # สิ่งที่ Frontend ส่งมาขอให้เรา Gen เลข
 class GenerateRequest(BaseModel):
     template_id: str
     user_seed: Optional[str] = None  # เลขตั้งต้น 2 ตัว (ถ้ามี) เช่น "85"
     slot_configs: List[Dict[str, Any]] # รายการ Slot จาก DB (เราจะเอา data_key มาดูว่าต้อง Gen อะไรบ้าง)
+    deterministic: bool = False  # ✅ True = ได้ชุดเลขเดิมทุกครั้งจาก (seed, วันที่งวด, template)
+    draw_date: Optional[date] = None  # วันที่งวด (ใช้กับโหมด deterministic, default = วันนี้)
 
 # สิ่งที่เราจะตอบกลับไป (Key: ค่าที่สุ่มได้)
 # ตัวอย่าง: { "digit_3": "851", "digit_2_bottom": "85", "running": "8" }
 class GenerateResponse(BaseModel):
     results: Dict[str, str]
+    draw_date: Optional[str] = None  # มีค่าเฉพาะโหมด deterministic ใช้ re-render / ตรวจสอบย้อนหลัง
 
 class SlotSchema(BaseModel):
     id: str
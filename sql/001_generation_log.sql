@@ -0,0 +1,23 @@
+-- Generation Log: ประวัติการออกเลข (append-only)
+-- เขียนโดย background flusher ใน generation_log.py แบบ batch insert
+
+create table if not exists generation_log (
+    id bigserial primary key,
+    template_id text not null,
+    seed text,
+    results jsonb not null,
+    draw_date date,
+    deterministic boolean not null default false,
+    created_at timestamptz not null default now()
+);
+
+-- ตารางที่สร้างไปก่อนหน้า: เพิ่ม column สำหรับคำนวณชุดเลขโหมด deterministic ซ้ำ
+alter table generation_log add column if not exists draw_date date;
+alter table generation_log add column if not exists deterministic boolean not null default false;
+
+create index if not exists generation_log_template_created_idx
+    on generation_log (template_id, created_at desc);
+
+-- Audit log ห้ามอ่าน/เขียนผ่าน anon key: เปิด RLS โดยไม่มี policy ให้ anon/authenticated
+-- (backend ใช้ service role key ซึ่งข้าม RLS อยู่แล้ว)
+alter table generation_log enable row level security;
@@ -0,0 +1,55 @@
+-- Cache Invalidation: ส่ง pg_notify ทุกครั้งที่ตารางที่ถูก cache มีการเปลี่ยนแปลง
+-- รวมถึงการแก้ไขตรงจาก Supabase dashboard / instance อื่น
+-- payload: {"table": "<table>", "id": "<row id>"} ตรงกับ InvalidationBus ใน invalidation.py
+
+create or replace function notify_cache_invalidation() returns trigger
+language plpgsql as $$
+declare
+    row_data jsonb;
+    target_table text := tg_argv[0];
+    id_column text := tg_argv[1];
+begin
+    if tg_op = 'DELETE' then
+        row_data := to_jsonb(old);
+    else
+        row_data := to_jsonb(new);
+    end if;
+
+    perform pg_notify(
+        'cache_invalidation',
+        json_build_object('table', target_table, 'id', row_data ->> id_column)::text
+    );
+    return null;
+end;
+$$;
+
+drop trigger if exists templates_cache_invalidation on templates;
+create trigger templates_cache_invalidation
+    after insert or update or delete on templates
+    for each row execute function notify_cache_invalidation('templates', 'id');
+
+-- Slots / Backgrounds เป็นส่วนหนึ่งของ template payload ที่ cache ไว้
+drop trigger if exists template_slots_cache_invalidation on template_slots;
+create trigger template_slots_cache_invalidation
+    after insert or update or delete on template_slots
+    for each row execute function notify_cache_invalidation('templates', 'template_id');
+
+drop trigger if exists template_backgrounds_cache_invalidation on template_backgrounds;
+create trigger template_backgrounds_cache_invalidation
+    after insert or update or delete on template_backgrounds
+    for each row execute function notify_cache_invalidation('templates', 'template_id');
+
+drop trigger if exists lotteries_cache_invalidation on lotteries;
+create trigger lotteries_cache_invalidation
+    after insert or update or delete on lotteries
+    for each row execute function notify_cache_invalidation('lotteries', 'id');
+
+drop trigger if exists users_cache_invalidation on users;
+create trigger users_cache_invalidation
+    after insert or update or delete on users
+    for each row execute function notify_cache_invalidation('users', 'id');
+
+drop trigger if exists global_configs_cache_invalidation on global_configs;
+create trigger global_configs_cache_invalidation
+    after insert or update or delete on global_configs
+    for each row execute function notify_cache_invalidation('global_configs', 'key');
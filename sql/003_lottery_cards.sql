@@ -0,0 +1,103 @@
+-- Lottery Cards: ตารางสำเร็จรูปสำหรับหน้า listing (/api/lotteries)
+-- แทนการ join lotteries -> templates + ilike '%x%' ทุก request
+--
+-- - card เก็บ JSON หน้าตาเดียวกับที่ endpoint เดิมคืน (lottery.* + templates{...})
+-- - trigger บน lotteries / templates คอยอัปเดต card ให้ตรงเสมอ
+-- - trigram index ทำให้ ilike '%x%' บน name ใช้ index ได้
+--
+-- ทดสอบกับ Postgres ในเครื่อง: psql -f sql/003_lottery_cards.sql && psql -f sql/003_lottery_cards_check.sql
+
+create extension if not exists pg_trgm;
+
+create table if not exists lottery_cards (
+    id uuid primary key references lotteries (id) on delete cascade,
+    name text not null,
+    is_active boolean not null default true,
+    closing_time timestamptz,
+    template_id uuid,
+    card jsonb not null
+);
+
+-- ห้ามอ่าน/เขียนผ่าน anon key: เปิด RLS โดยไม่มี policy ให้ anon/authenticated
+-- (backend ใช้ service role key ซึ่งข้าม RLS อยู่แล้ว)
+alter table lottery_cards enable row level security;
+
+create index if not exists lottery_cards_name_trgm_idx
+    on lottery_cards using gin (name gin_trgm_ops);
+
+create index if not exists lottery_cards_active_closing_idx
+    on lottery_cards (closing_time)
+    where is_active;
+
+create index if not exists lottery_cards_template_idx
+    on lottery_cards (template_id);
+
+-- สร้าง/อัปเดต card ของหวย 1 ตัว
+create or replace function refresh_lottery_card(p_lottery_id uuid) returns void
+language sql as $$
+    insert into lottery_cards (id, name, is_active, closing_time, template_id, card)
+    select
+        l.id,
+        l.name,
+        coalesce(l.is_active, false),
+        l.closing_time,
+        l.template_id,
+        to_jsonb(l) || jsonb_build_object(
+            'templates',
+            case when t.id is null then null else jsonb_build_object(
+                'background_url', t.background_url,
+                'base_width', t.base_width,
+                'base_height', t.base_height
+            ) end
+        )
+    from lotteries l
+    left join templates t on t.id = l.template_id
+    where l.id = p_lottery_id
+    on conflict (id) do update set
+        name = excluded.name,
+        is_active = excluded.is_active,
+        closing_time = excluded.closing_time,
+        template_id = excluded.template_id,
+        card = excluded.card;
+$$;
+
+-- trigger เป็น security definer: เขียน lottery_cards ได้แม้ role ที่แก้ lotteries/templates จะติด RLS
+create or replace function lottery_cards_on_lottery_change() returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    -- DELETE ถูกจัดการด้วย on delete cascade
+    perform refresh_lottery_card(new.id);
+    return null;
+end;
+$$;
+
+create or replace function lottery_cards_on_template_change() returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    template_uuid uuid := case when tg_op = 'DELETE' then old.id else new.id end;
+begin
+    perform refresh_lottery_card(c.id)
+    from lottery_cards c
+    where c.template_id = template_uuid;
+    return null;
+end;
+$$;
+
+drop trigger if exists lottery_cards_lottery_sync on lotteries;
+create trigger lottery_cards_lottery_sync
+    after insert or update on lotteries
+    for each row execute function lottery_cards_on_lottery_change();
+
+drop trigger if exists lottery_cards_template_sync on templates;
+create trigger lottery_cards_template_sync
+    after update or delete on templates
+    for each row execute function lottery_cards_on_template_change();
+
+-- Backfill ข้อมูลที่มีอยู่แล้ว
+select refresh_lottery_card(id) from lotteries;
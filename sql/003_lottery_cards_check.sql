@@ -0,0 +1,38 @@
+-- ตรวจ trigger ของ lottery_cards กับ Postgres ในเครื่อง (rollback ทั้งหมด ไม่ทิ้งข้อมูล)
+-- psql -v ON_ERROR_STOP=1 -f sql/003_lottery_cards_check.sql
+
+begin;
+
+do $$
+declare
+    t_id uuid;
+    l_id uuid;
+    c jsonb;
+begin
+    insert into templates (name, base_width, base_height, background_url, is_active)
+    values ('__check_template', 800, 600, 'https://example.com/a.png', true)
+    returning id into t_id;
+
+    insert into lotteries (name, template_id, is_active)
+    values ('__check หวยทดสอบ', t_id, true)
+    returning id into l_id;
+
+    select card into c from lottery_cards where id = l_id;
+    assert c is not null, 'card not created on lottery insert';
+    assert c -> 'templates' ->> 'background_url' = 'https://example.com/a.png', 'template not joined';
+
+    update templates set background_url = 'https://example.com/b.png' where id = t_id;
+    select card into c from lottery_cards where id = l_id;
+    assert c -> 'templates' ->> 'background_url' = 'https://example.com/b.png', 'card not refreshed on template update';
+
+    update lotteries set name = '__check renamed' where id = l_id;
+    assert exists (select 1 from lottery_cards where id = l_id and name ilike '%renamed%'), 'card not refreshed on lottery update';
+
+    delete from lotteries where id = l_id;
+    assert not exists (select 1 from lottery_cards where id = l_id), 'card not removed on lottery delete';
+
+    raise notice 'lottery_cards checks passed';
+end;
+$$;
+
+rollback;
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+postgrest = pytest.importorskip("postgrest")
+
+from resilience import CircuitBreaker, ResilientExecutor, is_transient
+
+
+def _client(status: int, body: dict, calls: list):
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(status, content=json.dumps(body), headers={"content-type": "application/json"})
+
+    client = postgrest.SyncPostgrestClient("http://postgrest.test")
+    client.session = httpx.Client(base_url="http://postgrest.test", transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_json_bodied_503_is_transient_and_retried():
+    calls = []
+    client = _client(503, {"code": "PGRST002", "message": "Could not query the database for the schema cache", "hint": None, "details": None}, calls)
+    db = ResilientExecutor(breaker=CircuitBreaker(failure_threshold=3), read_retries=2, backoff_base=0.001)
+
+    with pytest.raises(postgrest.APIError) as exc_info:
+        db.read(lambda: client.table("templates").select("*").execute())
+
+    assert is_transient(exc_info.value)
+    assert len(calls) == 3
+    assert db.breaker.state == CircuitBreaker.OPEN
+
+
+def test_statement_timeout_is_transient():
+    calls = []
+    client = _client(500, {"code": "57014", "message": "canceling statement due to statement timeout", "hint": None, "details": None}, calls)
+
+    with pytest.raises(postgrest.APIError) as exc_info:
+        client.table("templates").select("*").execute()
+
+    assert is_transient(exc_info.value)
+
+
+def test_client_error_is_not_transient():
+    calls = []
+    client = _client(400, {"code": "PGRST100", "message": "bad filter", "hint": None, "details": None}, calls)
+    db = ResilientExecutor(read_retries=2, backoff_base=0.001)
+
+    with pytest.raises(postgrest.APIError) as exc_info:
+        db.read(lambda: client.table("templates").select("*").execute())
+
+    assert not is_transient(exc_info.value)
+    assert len(calls) == 1
+    assert db.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,164 @@
+"""
+Warm-up Job: โหลดข้อมูลที่ใช้บ่อยเข้า cache ล่วงหน้า
+
+- รันครั้งแรกตอน startup (ก่อนหน้านั้น /health จะตอบว่ากำลัง warming)
+- รันซ้ำก่อนเวลาปิดรับ (closing_time) ที่ใกล้ที่สุดตามจำนวนนาทีที่ตั้งไว้
+  entry ที่ warm ไว้ให้งวดไหนจะอยู่จนเลย closing_time ของงวดนั้น (ไม่หมด TTL กลางช่วงปิดรับ)
+- เก็บ progress / duration ไว้ให้ /health รายงาน
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+ReportFn = Callable[[int, int], None]
+
+# ระยะรอขั้นต่ำระหว่างเช็ค closing_time ใหม่ กัน loop หมุนถี่ตอนใกล้เวลาปิด
+MIN_RECHECK_SECONDS = 1.0
+
+
+class WarmupJob:
+    PENDING = "pending"
+    RUNNING = "running"
+    WARM = "warm"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        warm_fn: Callable[[ReportFn, Optional[float]], None],
+        next_closing_fn: Callable[[], Optional[datetime]],
+        lead_minutes: float = 10.0,
+        recheck_seconds: float = 1800.0,
+        hold_after_closing_seconds: float = 300.0,
+    ):
+        """
+        warm_fn(report, hold_seconds): โหลดข้อมูลเข้า cache แล้วเรียก report(done, total) ระหว่างทาง
+            hold_seconds = ระยะที่ entry ต้องอยู่ได้ (ถึง closing_time + hold_after_closing_seconds)
+            หรือ None ถ้าไม่ได้ warm ให้งวดไหน
+        next_closing_fn(): คืน closing_time ที่ใกล้ที่สุดในอนาคต (timezone-aware) หรือ None
+        """
+        self.warm_fn = warm_fn
+        self.next_closing_fn = next_closing_fn
+        self.lead = timedelta(minutes=lead_minutes)
+        self.recheck_seconds = recheck_seconds
+        self.hold_after_closing = timedelta(seconds=hold_after_closing_seconds)
+        self.state = self.PENDING
+        self.reason: Optional[str] = None
+        self.done = 0
+        self.total = 0
+        self.runs = 0
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.duration_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.next_run_at: Optional[datetime] = None
+        self._warmed_for: Optional[datetime] = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """ผ่าน warm-up รอบแรกแล้ว (สำเร็จหรือไม่ก็ตาม ไม่ให้ค้างสถานะ not ready ตลอดไปถ้า DB ล่ม)"""
+        return self.runs > 0
+
+    def _report(self, done: int, total: int):
+        self.done = done
+        self.total = total
+
+    def run_once(self, reason: str, closing: Optional[datetime] = None) -> bool:
+        """closing: งวดที่ warm ให้ entry จะอยู่จนเลย closing_time นี้"""
+        hold_seconds = None
+        if closing is not None:
+            hold_seconds = max(0.0, (closing + self.hold_after_closing - datetime.now(timezone.utc)).total_seconds())
+        with self._run_lock:
+            self.state = self.RUNNING
+            self.reason = reason
+            self.done = 0
+            self.total = 0
+            self.started_at = datetime.now(timezone.utc)
+            started = time.perf_counter()
+            try:
+                self.warm_fn(self._report, hold_seconds)
+                self.state = self.WARM
+                self.last_error = None
+                return True
+            except Exception as e:
+                print("Warm-up failed:", e)
+                self.state = self.FAILED
+                self.last_error = str(e)
+                return False
+            finally:
+                self.duration_ms = (time.perf_counter() - started) * 1000
+                self.finished_at = datetime.now(timezone.utc)
+                self.runs += 1
+
+    # ---------- Scheduler ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="warmup-job", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _next_closing(self) -> Optional[datetime]:
+        try:
+            return self.next_closing_fn()
+        except Exception as e:
+            print("Warm-up: cannot read next closing_time -", e)
+            return None
+
+    def _loop(self):
+        # ถ้าตอน startup อยู่ในช่วง lead ของงวดถัดไปแล้ว ถือว่า warm ให้งวดนั้นเลย
+        closing = self._next_closing()
+        if closing and closing - self.lead <= datetime.now(timezone.utc):
+            self.run_once("startup", closing)
+            self._warmed_for = closing
+        else:
+            self.run_once("startup")
+
+        while not self._stop.is_set():
+            closing = self._next_closing()
+            if closing is None:
+                self.next_run_at = None
+                self._stop.wait(self.recheck_seconds)
+                continue
+            if closing == self._warmed_for:
+                # งวดนี้ warm แล้ว รอถึงแค่ closing_time แล้วเช็คงวดถัดไป
+                # (รอเต็ม recheck อาจข้าม lead ของงวดถัดไปที่ปิดใกล้กัน)
+                self.next_run_at = None
+                until_closing = (closing - datetime.now(timezone.utc)).total_seconds()
+                self._stop.wait(min(self.recheck_seconds, max(until_closing, MIN_RECHECK_SECONDS)))
+                continue
+
+            run_at = closing - self.lead
+            self.next_run_at = run_at
+            delay = (run_at - datetime.now(timezone.utc)).total_seconds()
+            if delay > self.recheck_seconds:
+                # ยังอีกนาน รอแล้วค่อยเช็คใหม่ (closing_time อาจถูกแก้ระหว่างนี้)
+                self._stop.wait(self.recheck_seconds)
+                continue
+            if delay > 0 and self._stop.wait(delay):
+                break
+
+            self.run_once("pre-draw", closing)
+            self._warmed_for = closing
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "reason": self.reason,
+            "progress": {"done": self.done, "total": self.total},
+            "runs": self.runs,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_ms": round(self.duration_ms, 1) if self.duration_ms is not None else None,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+        }